@@ -0,0 +1,233 @@
+# coding: utf-8
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from expression import *
+
+# level of the terminals, below every variable
+TERMINAL = 1 << 30
+
+FALSE = 0
+TRUE = 1
+
+
+class BDD:
+    """Reduced ordered binary decision diagrams, all sharing the same unique table
+
+    Nodes are ints: 0 and 1 are the terminals, the others index the (level, low, high) table."""
+
+    def __init__(self, variables: Iterable[str] = ()):
+        self.variables: List[str] = []
+        self.levels: Dict[str, int] = {}
+        self.nodes: List[Tuple[int, int, int]] = [(TERMINAL, FALSE, FALSE), (TERMINAL, TRUE, TRUE)]
+        self.unique: Dict[Tuple[int, int, int], int] = {}
+        self.computed: Dict[Tuple[int, int, int], int] = {}
+        for name in variables:
+            self.add_var(name)
+
+    def add_var(self, name: str) -> int:
+        """Adds a variable below the existing ones, returns its level"""
+        if name not in self.levels:
+            self.levels[name] = len(self.variables)
+            self.variables.append(name)
+        return self.levels[name]
+
+    def get_level(self, u: int) -> int:
+        return self.nodes[u][0]
+
+    def make(self, level: int, low: int, high: int) -> int:
+        if low == high:
+            return low
+        key = level, low, high
+        if key not in self.unique:
+            self.unique[key] = len(self.nodes)
+            self.nodes.append(key)
+        return self.unique[key]
+
+    def var(self, name: str) -> int:
+        return self.make(self.add_var(name), FALSE, TRUE)
+
+    def cofactors(self, u: int, level: int) -> Tuple[int, int]:
+        lvl, low, high = self.nodes[u]
+        if lvl != level:
+            return u, u
+        return low, high
+
+    def ite(self, f: int, g: int, h: int) -> int:
+        """If f then g else h"""
+        if f == TRUE:
+            return g
+        if f == FALSE:
+            return h
+        if g == h:
+            return g
+        if g == TRUE and h == FALSE:
+            return f
+        key = f, g, h
+        if key in self.computed:
+            return self.computed[key]
+        top = min(self.get_level(f), self.get_level(g), self.get_level(h))
+        f0, f1 = self.cofactors(f, top)
+        g0, g1 = self.cofactors(g, top)
+        h0, h1 = self.cofactors(h, top)
+        res = self.computed[key] = self.make(top, self.ite(f0, g0, h0), self.ite(f1, g1, h1))
+        return res
+
+    def neg(self, u: int) -> int:
+        return self.ite(u, FALSE, TRUE)
+
+    def apply(self, op: type, u: int, v: int) -> int:
+        if op is And:
+            return self.ite(u, v, FALSE)
+        if op is Or:
+            return self.ite(u, TRUE, v)
+        if op is Imp:
+            return self.ite(u, v, TRUE)
+        if op is Equ:
+            return self.ite(u, v, self.neg(v))
+        raise NotImplementedError
+
+    def from_term(self, term: Term, deadline: Optional[float] = None) -> Optional[int]:
+        """Node of term, or None if the (monotonic) deadline passes first"""
+        nodes: Dict[Term, int] = {}
+        stack = [(term, False)]
+        while stack:
+            if deadline is not None and time.monotonic() > deadline:
+                return None
+            t, ready = stack.pop()
+            if t in nodes:
+                continue
+            if isinstance(t, Literal):
+                nodes[t] = TRUE if isinstance(t, Positive) else FALSE
+                continue
+            if isinstance(t, NamedValue):
+                nodes[t] = self.var(t.name)
+                continue
+            if not isinstance(t, (Not, VariadicOp, BinOp)):
+                raise NotImplementedError
+            args = t.get_args()
+            if not ready:
+                stack.append((t, True))
+                stack.extend((arg, False) for arg in args)
+                continue
+            if isinstance(t, Not):
+                nodes[t] = self.neg(nodes[t.elem])
+            elif isinstance(t, VariadicOp):
+                res = TRUE if isinstance(t, And) else FALSE
+                for arg in args:
+                    if deadline is not None and time.monotonic() > deadline:
+                        return None
+                    res = self.apply(type(t), res, nodes[arg])
+                nodes[t] = res
+            else:
+                nodes[t] = self.apply(type(t), nodes[args[0]], nodes[args[1]])
+        return nodes[term]
+
+    def get_nodes(self, *roots: int) -> List[int]:
+        """Inner nodes reachable from the roots"""
+        seen = set()
+        stack = [u for u in roots if u > TRUE]
+        while stack:
+            u = stack.pop()
+            if u in seen:
+                continue
+            seen.add(u)
+            stack.extend(child for child in self.nodes[u][1:] if child > TRUE)
+        return list(seen)
+
+    def get_size(self, *roots: int) -> int:
+        return len(self.get_nodes(*roots))
+
+    def count(self, u: int) -> int:
+        """Number of assignments of all the variables of the diagram for which u is true"""
+        n = len(self.variables)
+        counts = {FALSE: 0, TRUE: 1}
+
+        def level(v: int) -> int:
+            return min(self.get_level(v), n)
+
+        # the assignments below each node, counting the variables from its level down
+        for v in sorted(self.get_nodes(u), key=self.get_level, reverse=True):
+            lvl, low, high = self.nodes[v]
+            counts[v] = (counts[low] << (level(low) - lvl - 1)) + (counts[high] << (level(high) - lvl - 1))
+        return counts[u] << level(u)
+
+    def get_truth_density(self, u: int) -> float:
+        return self.count(u) / (1 << len(self.variables))
+
+    def get_model(self, u: int) -> Optional[Interpretation]:
+        """An assignment of all the variables for which u is true, if there is one"""
+        if u == FALSE:
+            return None
+        values = dict.fromkeys(self.variables, False)
+        while u != TRUE:
+            lvl, low, high = self.nodes[u]
+            values[self.variables[lvl]] = low == FALSE
+            u = high if low == FALSE else low
+        return Interpretation(values)
+
+    def transfer(self, roots: Sequence[int], order: Sequence[str]) -> Tuple["BDD", List[int]]:
+        """The same functions in a new diagram with the given variable order"""
+        res = BDD(order)
+        nodes = {FALSE: FALSE, TRUE: TRUE}
+        for u in sorted(self.get_nodes(*roots), key=self.get_level, reverse=True):
+            lvl, low, high = self.nodes[u]
+            nodes[u] = res.ite(res.var(self.variables[lvl]), nodes[high], nodes[low])
+        return res, [nodes[u] for u in roots]
+
+    def sift(self, roots: Sequence[int], max_growth: float = 1.2) -> Tuple["BDD", List[int]]:
+        """Sifting reordering: moves each variable, most used first, to the position where the diagram is smallest
+
+        Each position is tried by rebuilding the diagram, and a variable stops moving in one direction once the size
+        grows past max_growth times the best one."""
+        best, best_roots = self, list(roots)
+        best_size = self.get_size(*roots)
+        uses = {}
+        for u in self.get_nodes(*roots):
+            uses[self.nodes[u][0]] = uses.get(self.nodes[u][0], 0) + 1
+        for name in sorted(self.variables, key=lambda name: -uses.get(self.levels[name], 0)):
+            order = [v for v in best.variables if v != name]
+            start = best.levels[name]
+            candidates = {}
+            for direction in (range(start - 1, -1, -1), range(start + 1, len(order) + 1)):
+                for pos in direction:
+                    bdd, nroots = best.transfer(best_roots, order[:pos] + [name] + order[pos:])
+                    size = bdd.get_size(*nroots)
+                    candidates[pos] = size, bdd, nroots
+                    if size > max_growth * best_size:
+                        break
+            for size, bdd, nroots in candidates.values():
+                if size < best_size:
+                    best, best_roots, best_size = bdd, nroots, size
+        return best, best_roots
+
+
+def from_terms(*terms: Term) -> Tuple[BDD, List[int]]:
+    names = set()
+    for term in terms:
+        names.update(v.name for v in term.get_vars())
+    bdd = BDD(sorted(names))
+    return bdd, [bdd.from_term(term) for term in terms]
+
+
+def are_equivalent(a: Term, b: Term) -> bool:
+    bdd, (u, v) = from_terms(a, b)
+    return u == v
+
+
+def is_sat(term: Term) -> bool:
+    return from_terms(term)[1][0] != FALSE
+
+
+def is_tautology(term: Term) -> bool:
+    return from_terms(term)[1][0] == TRUE
+
+
+def count_models(term: Term) -> int:
+    bdd, (u,) = from_terms(term)
+    return bdd.count(u)
+
+
+def get_truth_density(term: Term) -> float:
+    bdd, (u,) = from_terms(term)
+    return bdd.get_truth_density(u)
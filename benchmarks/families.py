@@ -0,0 +1,54 @@
+# coding: utf-8
+import random
+
+# formula generators, all returning source text so that parsing can be measured too
+# variables are uppercase, since lowercase names parse as constants
+
+
+def random_cnf(variables: int, clauses: int, k: int = 3, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    res = []
+    for _ in range(clauses):
+        lits = rng.sample(range(variables), min(k, variables))
+        res.append("(" + " | ".join(("!" if rng.random() < 0.5 else "") + f"X{v}" for v in lits) + ")")
+    return " & ".join(res)
+
+
+def parity_chain(n: int) -> str:
+    """X0 xor X1 xor ... written with equivalences and negations"""
+    res = "X0"
+    for i in range(1, n):
+        res = f"!({res} <-> X{i})"
+    return res
+
+
+def wide_and(n: int) -> str:
+    return " & ".join(f"X{i}" for i in range(n))
+
+
+def wide_or(n: int) -> str:
+    return " | ".join(f"(X{i} & !Y{i})" for i in range(n))
+
+
+def deep_nesting(n: int) -> str:
+    """Alternating operators nested n levels deep"""
+    res = "X0"
+    for i in range(1, n):
+        res = f"!(X{i} {'&|'[i % 2]} ({res}))"
+    return res
+
+
+def quantified(n: int) -> str:
+    parts = [f"(∀X P{i}(X) -> Q{i}(X))" for i in range(n)]
+    parts.append("∃X !Q0(X)")
+    return " & ".join(parts)
+
+
+FAMILIES = {
+    "cnf": lambda n: random_cnf(n, 4 * n),
+    "parity": parity_chain,
+    "wide_and": wide_and,
+    "wide_or": wide_or,
+    "deep": deep_nesting,
+    "quantified": quantified
+}
@@ -0,0 +1,140 @@
+# coding: utf-8
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+from typing import Callable, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expression import *
+
+KINDS = {
+    "Variable": lambda leaves, i: Variable(f"V{i}"),
+    "NamedPredicate": lambda leaves, i: NamedPredicate("P", (leaves[i],)),
+    "Not": lambda leaves, i: Not(leaves[i]),
+    "And": lambda leaves, i: And((leaves[i], leaves[i - 1])),
+    "Imp": lambda leaves, i: Imp((leaves[i], leaves[i - 1])),
+    "Universal": lambda leaves, i: Universal(Variable("X"), leaves[i])
+}
+
+
+def measure(build: Callable[[List[Term], int], Term], leaves: List[Term]) -> float:
+    """Bytes allocated per node, including the entry in the table of interned terms"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    nodes = [build(leaves, i) for i in range(len(leaves))]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # the list holding the nodes isn't part of them
+    return (after - before - sys.getsizeof(nodes)) / len(nodes)
+
+
+def get_children(term: Term) -> List[Term]:
+    if isinstance(term, Not):
+        return [term.elem]
+    if isinstance(term, Quantifier):
+        return [term.var, term.expr]
+    if isinstance(term, Predicate):
+        return list(term.args)
+    return []
+
+
+def count_nodes(term: Term) -> int:
+    """Nodes of the tree, counting a shared subterm once per occurrence"""
+    res, stack = 0, [term]
+    while stack:
+        res += 1
+        stack.extend(get_children(stack.pop()))
+    return res
+
+
+def rebuild(term: Term, find: str) -> Term:
+    """New copy of the tree with the variable called find negated, the way a rewriting pass builds its result"""
+    if isinstance(term, NamedValue):
+        return Not(Variable(term.name)) if term.name == find else type(term)(term.name)
+    if isinstance(term, Not):
+        return Not(rebuild(term.elem, find))
+    return type(term)([rebuild(arg, find) for arg in term.args])
+
+
+def build_tree(leaves: List[Term], lo: int, hi: int, level: int = 0) -> Term:
+    """Balanced tree over the leaves, alternating the kind of node with the level"""
+    if hi - lo == 1:
+        return leaves[lo]
+    mid = (lo + hi) // 2
+    left, right = build_tree(leaves, lo, mid, level + 1), build_tree(leaves, mid, hi, level + 1)
+    if level % 3 == 0:
+        return And((left, Not(right)))
+    return Imp((left, right)) if level % 3 == 1 else Or((left, right))
+
+
+def measure_formulas(build: Callable[[], List[Term]]) -> float:
+    """Bytes allocated per node occurrence of the formulas"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    formulas = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before - sys.getsizeof(formulas)) / sum(map(count_nodes, formulas))
+
+
+def build_distinct(n: int) -> List[Term]:
+    # every node is different from the others: interning can't share anything
+    return [build_tree([Variable(f"D{i}") for i in range(n)], 0, n)]
+
+
+def build_rewritten(n: int) -> List[Term]:
+    # variants of one formula, each with one variable changed, like the candidates of a simplification round
+    base = build_tree([Variable(f"R{i % 64}") for i in range(1024)], 0, 1024)
+    return [rebuild(base, f"R{i % 64}") for i in range(max(1, n // 2048))]
+
+
+FORMULAS = {
+    "distinct formula": build_distinct,
+    "rewritten formulas": build_rewritten
+}
+
+# bytes per node measured with this script on the tree before terms were interned and slotted, with Python 3.11 and the
+# default -n; the rows built one node at a time hold a new leaf each, which is counted for the nodes above as well
+BASELINE = {
+    "Variable": 134.9,
+    "NamedPredicate": 136.0,
+    "Not": 80.0,
+    "And": 368.0,
+    "Imp": 200.0,
+    "Universal": 168.0,
+    "distinct formula": 193.4,
+    "rewritten formulas": 183.0
+}
+
+
+def get_object_size(node: Term) -> int:
+    """Size of the node object itself, with its attribute dict if it has one"""
+    return sys.getsizeof(node) + (sys.getsizeof(node.__dict__) if hasattr(node, "__dict__") else 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory used by each kind of term node, against the tree before "
+                                                 "interning")
+    parser.add_argument("-n", type=int, default=100000, help="number of nodes built per kind")
+    args = parser.parse_args()
+
+    def row(name: str, size: float, extra: str = "") -> str:
+        base = BASELINE.get(name)
+        return f"{name:<20}{size:>12.1f}{base:>10.1f}{size / base:>7.2f}x{extra}"
+
+    leaves = [Variable(f"L{i}") for i in range(args.n)]
+    print(f"{'kind':<20}{'bytes/node':>12}{'baseline':>10}{'ratio':>8}{'object':>8}{'has __dict__':>14}")
+    for name, build in KINDS.items():
+        node = build(leaves, 1)
+        print(row(name, measure(build, leaves), f"{get_object_size(node):>8}{str(hasattr(node, '__dict__')):>14}"))
+    for name, build in FORMULAS.items():
+        print(row(name, measure_formulas(lambda: build(args.n))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# coding: utf-8
+import argparse
+import functools
+import os
+import sys
+import time
+from typing import Callable
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cache
+from expression import *
+from parse import parse
+from simplify import simplify
+
+FORMULAS = [
+    "((P & Q) & !R) | (P & !(Q | R))",
+    "(((!Q & !R) | (Q & !R)) & P)",
+    "(A & !B) | (!A & B) => (A | B) & (!A | !B)",
+    "!(A | B | C) & (A -> B) & (B <-> !C)",
+    "(A & B) | (A & !B) | (!A & B) | (!A & !B)",
+    "∀X P(X) & !P(X)",
+    "(∀X P(X)) => (∃X P(X))"
+]
+
+
+def apply_sub_sequential(term: Term, find: Term, replace: Term) -> Term:
+    """Previous implementation: one full rebuild of the tree per binding"""
+    if term == find:
+        return replace
+    return term.map_fields(lambda val: apply_sub_sequential(val, find, replace))
+
+
+def apply_subs_sequential(term: Term, subs) -> Term:
+    return functools.reduce(lambda cur, sub: apply_sub_sequential(cur, *sub), subs.items(), term)
+
+
+def timed(func: Callable, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_substitution(width: int, repeat: int) -> float:
+    names = [Variable(f"V{i}") for i in range(width)]
+    term = And([Or([names[i], Not(names[(i + 1) % width]), NamedPredicate("P", (names[(i * 7) % width],))])
+                for i in range(width)])
+    subs = {v: Constant(f"c{i}") for i, v in enumerate(names)}
+    assert term.apply_subs(subs) is apply_subs_sequential(term, subs)
+    old = timed(lambda: apply_subs_sequential(term, subs), repeat)
+    new = timed(lambda: term.apply_subs(subs), repeat)
+    print(f"substitute {width} bindings in {term.get_size()} nodes: {old * 1e3:.2f} ms -> {new * 1e3:.2f} ms "
+          f"({old / new:.1f}x)")
+
+
+def bench_simplify(repeat: int):
+    terms = [parse(f) for f in FORMULAS]
+
+    def run():
+        cache.clear()
+        for t in terms:
+            simplify(t)
+
+    current = Term.apply_subs
+    Term.apply_subs = apply_subs_sequential
+    try:
+        old = timed(run, repeat)
+    finally:
+        Term.apply_subs = current
+    new = timed(run, repeat)
+    print(f"simplify {len(terms)} formulas: {old * 1e3:.1f} ms -> {new * 1e3:.1f} ms ({old / new:.1f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Single-pass substitution against one rebuild per binding")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    for width in (4, 16, 64, 256):
+        bench_substitution(width, args.repeat)
+    bench_simplify(args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+# coding: utf-8
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cache
+import qmc
+from families import FAMILIES
+from parse import parse
+from rules import RULES_DNF
+from simplify import simplify
+from truth_table import TruthTable
+from unify import find_unifications
+
+# a case prepares its input once, then the returned function is what gets measured
+Case = Callable[[], Callable[[], Any]]
+
+# sizes per operation, kept small where the operation is exponential
+SIZES = {
+    "parse": (10, 100, 1000),
+    "unify": (4, 16, 64),
+    "simplify": (2, 4, 8),
+    "truth_table": (8, 16, 24),
+    "qmc": (6, 8, 10)
+}
+# sizes for some families, where matching the commutative patterns of the rules blows up faster
+FAMILY_SIZES = {
+    ("unify", "cnf"): (1, 2, 3),
+    ("unify", "wide_and"): (4, 8, 12),
+    ("unify", "wide_or"): (4, 8, 12),
+    ("unify", "quantified"): (2, 4, 8),
+    ("simplify", "cnf"): (2, 3, 4)
+}
+
+
+def get_sizes(op: str, family: str) -> Tuple[int, ...]:
+    return FAMILY_SIZES.get((op, family), SIZES[op])
+
+
+def fresh(func: Callable[[], Any]) -> Callable[[], Any]:
+    """Runs func with empty memoization caches, so that every run does the whole work"""
+    def run():
+        cache.clear()
+        return func()
+
+    return run
+
+
+def parse_case(source: str) -> Case:
+    return lambda: lambda: parse(source)
+
+
+def unify_case(source: str) -> Case:
+    def setup():
+        term = parse(source)
+        subterms = list(dict.fromkeys(term.get_children()))
+        patterns = list(RULES_DNF.keys())
+        return fresh(lambda: sum(len(find_unifications(t, p)) for t in subterms for p in patterns))
+
+    return setup
+
+
+def simplify_case(source: str) -> Case:
+    def setup():
+        term = parse(source)
+        return fresh(lambda: simplify(term))
+
+    return setup
+
+
+def truth_table_case(source: str) -> Case:
+    def setup():
+        term = parse(source)
+        return lambda: TruthTable.from_term(term)
+
+    return setup
+
+
+def qmc_case(bits: int) -> Case:
+    def setup():
+        rng = random.Random(bits)
+        minterms = [m for m in range(1 << bits) if rng.random() < 0.4]
+        return lambda: qmc.execute(bits, *minterms)
+
+    return setup
+
+
+def get_cases() -> Dict[str, Case]:
+    cases = {}
+    for family, make in FAMILIES.items():
+        for n in get_sizes("parse", family):
+            cases[f"parse/{family}/{n}"] = parse_case(make(n))
+        for n in get_sizes("unify", family):
+            cases[f"unify/{family}/{n}"] = unify_case(make(n))
+        for n in get_sizes("simplify", family):
+            cases[f"simplify/{family}/{n}"] = simplify_case(make(n))
+        if family != "quantified":
+            for n in get_sizes("truth_table", family):
+                # the families other than cnf have several variables per unit of size
+                size = n if family in ("cnf", "parity", "wide_and", "deep") else n // 2
+                cases[f"truth_table/{family}/{n}"] = truth_table_case(make(size))
+    for n in SIZES["qmc"]:
+        cases[f"qmc/random/{n}"] = qmc_case(n)
+    return cases
+
+
+def measure(case: Case, repeat: int, min_time: float) -> Dict[str, Any]:
+    """Timings of runs of the case, at least repeat of them and at least min_time in total, and its peak memory"""
+    func = case()
+    times: List[float] = []
+    total = 0.0
+    while len(times) < repeat or total < min_time:
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+        total += times[-1]
+
+    # on a separate run, since tracing slows it down
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "runs": len(times),
+        "min": min(times),
+        "median": statistics.median(times),
+        "peak_bytes": peak
+    }
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+            threshold: float) -> List[Tuple[str, float]]:
+    """Cases whose best time got slower than threshold times the baseline, with the ratio"""
+    res = []
+    for name, result in results.items():
+        if name in baseline and baseline[name]["min"] > 0:
+            ratio = result["min"] / baseline[name]["min"]
+            if ratio > threshold:
+                res.append((name, ratio))
+    return res
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Times parsing, unification, simplification, truth tables and qmc "
+                                                 "on generated formula families")
+    parser.add_argument("-k", "--filter", default="", help="only run the cases whose name contains this")
+    parser.add_argument("--repeat", type=int, default=5, help="minimum number of runs per case")
+    parser.add_argument("--min-time", type=float, default=0.2, help="minimum total time per case, in seconds")
+    parser.add_argument("-o", "--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON file of a previous run to check for regressions")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slowdown ratio reported as a regression")
+    parser.add_argument("--list", action="store_true", help="list the cases and exit")
+    args = parser.parse_args()
+
+    cases = {name: case for name, case in get_cases().items() if args.filter in name}
+    if args.list:
+        print("\n".join(cases))
+        return
+
+    results = {}
+    for name, case in cases.items():
+        results[name] = res = measure(case, args.repeat, args.min_time)
+        print(f"{name:<32}{res['min'] * 1e3:>12.3f} ms{res['median'] * 1e3:>12.3f} ms"
+              f"{res['peak_bytes'] / 1024:>12.1f} KiB", flush=True)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for name, ratio in regressions:
+            print(f"regression: {name} is {ratio:.2f}x slower")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
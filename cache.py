@@ -0,0 +1,262 @@
+# coding: utf-8
+import dataclasses
+import functools
+import inspect
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import tracing
+from expression import Term
+
+MISSING = object()
+
+
+@dataclasses.dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    def get_hit_rate(self) -> float:
+        return self.hits / ((self.hits + self.misses) or 1)
+
+
+class Cache(ABC):
+    def __init__(self, maxsize: Optional[int] = 1024):
+        self.maxsize = maxsize
+        self.stats = CacheStats()
+
+    def get(self, key: Hashable) -> Any:
+        """Cached value for key, or MISSING"""
+        value = self._get(key)
+        if value is MISSING:
+            self.stats.misses += 1
+        else:
+            self.stats.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        if self.maxsize is not None and self.maxsize <= 0:
+            return
+        self._put(key, value)
+
+    @abstractmethod
+    def _get(self, key: Hashable) -> Any:
+        raise NotImplementedError
+
+    @abstractmethod
+    def _put(self, key: Hashable, value: Any):
+        raise NotImplementedError
+
+    @abstractmethod
+    def __len__(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def clear(self):
+        raise NotImplementedError
+
+
+class LRUCache(Cache):
+    def __init__(self, maxsize: Optional[int] = 1024):
+        super().__init__(maxsize)
+        self.values = OrderedDict()
+
+    def _get(self, key):
+        value = self.values.get(key, MISSING)
+        if value is not MISSING:
+            self.values.move_to_end(key)
+        return value
+
+    def _put(self, key, value):
+        self.values[key] = value
+        self.values.move_to_end(key)
+        while self.maxsize is not None and len(self.values) > self.maxsize:
+            self.values.popitem(last=False)
+            self.stats.evictions += 1
+
+    def __len__(self):
+        return len(self.values)
+
+    def clear(self):
+        self.values.clear()
+
+
+class LFUCache(Cache):
+    def __init__(self, maxsize: Optional[int] = 1024):
+        super().__init__(maxsize)
+        self.values = {}
+        self.counts = {}
+        # keys by use count, each bucket from least to most recently used
+        self.buckets: Dict[int, OrderedDict] = {}
+        self.min_count = 0
+
+    def _get(self, key):
+        value = self.values.get(key, MISSING)
+        if value is not MISSING:
+            self.__touch(key)
+        return value
+
+    def __touch(self, key):
+        count = self.counts[key]
+        bucket = self.buckets[count]
+        del bucket[key]
+        if not bucket:
+            del self.buckets[count]
+            if self.min_count == count:
+                self.min_count = count + 1
+        self.counts[key] = count + 1
+        self.buckets.setdefault(count + 1, OrderedDict())[key] = None
+
+    def _put(self, key, value):
+        if key in self.values:
+            self.values[key] = value
+            self.__touch(key)
+            return
+        while self.maxsize is not None and self.values and len(self.values) >= self.maxsize:
+            bucket = self.buckets[self.min_count]
+            old, _ = bucket.popitem(last=False)
+            if not bucket:
+                del self.buckets[self.min_count]
+            del self.values[old], self.counts[old]
+            self.stats.evictions += 1
+        self.values[key] = value
+        self.counts[key] = 1
+        self.buckets.setdefault(1, OrderedDict())[key] = None
+        self.min_count = 1
+
+    def __len__(self):
+        return len(self.values)
+
+    def clear(self):
+        self.values.clear()
+        self.counts.clear()
+        self.buckets.clear()
+        self.min_count = 0
+
+
+def get_weight(key: Hashable) -> int:
+    """Number of term nodes in a key"""
+    if isinstance(key, Term):
+        return key.get_size()
+    if isinstance(key, tuple):
+        return max(1, sum(map(get_weight, key)))
+    return 0
+
+
+class SizeCache(LRUCache):
+    """Least recently used entries are evicted until the total weight of the keys is at most maxsize"""
+    def __init__(self, maxsize: Optional[int] = 1024, weigh: Callable[[Hashable], int] = get_weight):
+        super().__init__(maxsize)
+        self.weigh = weigh
+        self.weights = {}
+        self.total = 0
+
+    def _put(self, key, value):
+        self.total -= self.weights.get(key, 0)
+        self.weights[key] = self.weigh(key)
+        self.total += self.weights[key]
+        self.values[key] = value
+        self.values.move_to_end(key)
+        while self.maxsize is not None and self.total > self.maxsize and len(self.values) > 1:
+            old, _ = self.values.popitem(last=False)
+            self.total -= self.weights.pop(old)
+            self.stats.evictions += 1
+
+    def clear(self):
+        super().clear()
+        self.weights.clear()
+        self.total = 0
+
+
+POLICIES = {
+    "lru": LRUCache,
+    "lfu": LFUCache,
+    "size": SizeCache
+}
+
+DEFAULTS = {
+    "maxsize": 1024,
+    "policy": "lru"
+}
+
+settings: Dict[str, Dict[str, Any]] = {}
+caches: Dict[str, Dict[Hashable, Cache]] = {}
+
+
+def configure(name: Optional[str] = None, **options):
+    """Sets the maxsize and/or policy of the caches called name, or the defaults of all of them
+
+    The caches concerned are dropped, along with their counters."""
+    if name is None:
+        DEFAULTS.update(options)
+        caches.clear()
+    else:
+        settings.setdefault(name, {}).update(options)
+        caches.pop(name, None)
+
+
+def get_cache(name: str, namespace: Hashable = None) -> Cache:
+    spaces = caches.setdefault(name, {})
+    if namespace not in spaces:
+        options = {**DEFAULTS, **settings.get(name, {})}
+        spaces[namespace] = POLICIES[options["policy"]](options["maxsize"])
+    return spaces[namespace]
+
+
+def get_stats(name: Optional[str] = None) -> Dict[str, Dict[Hashable, CacheStats]]:
+    return {n: {ns: cache.stats for ns, cache in spaces.items()}
+            for n, spaces in caches.items() if name is None or n == name}
+
+
+def clear(name: Optional[str] = None):
+    for n, spaces in caches.items():
+        if name is None or n == name:
+            for cache in spaces.values():
+                cache.clear()
+
+
+def cached(name: str, namespace: Optional[str] = None):
+    """Memoizes a function in the caches called name, with one cache per value of the argument called namespace
+
+    The function must only have plain parameters: the key is the value of each of them, in order, defaults included."""
+    def decorator(func):
+        params = inspect.signature(func).parameters.values()
+        if any(p.kind not in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD) for p in params):
+            raise TypeError(f"Can't cache {func.__name__}: only plain parameters are supported")
+        # worked out once here, as binding the arguments on each call costs more than most cache hits
+        names = tuple(p.name for p in params)
+        defaults = tuple(p.default for p in params)
+        required = sum(d is inspect.Parameter.empty for d in defaults)
+        index = names.index(namespace) if namespace else None
+
+        def get_values(args: tuple, kwargs: dict) -> tuple:
+            if not kwargs and required <= len(args) <= len(names):
+                return args + defaults[len(args):]
+            values = args + tuple(kwargs.get(n, d) for n, d in zip(names[len(args):], defaults[len(args):]))
+            if len(values) != len(names) or any(v is inspect.Parameter.empty for v in values) or \
+                    len(kwargs) != sum(n in kwargs for n in names[len(args):]):
+                raise TypeError(f"Invalid arguments for {func.__name__}")
+            return values
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            values = get_values(args, kwargs)
+            if index is None:
+                key, space = values, None
+            else:
+                key, space = values[:index] + values[index + 1:], values[index]
+            cache = get_cache(name, space)
+            res = cache.get(key)
+            if tracing.tracer is not None:
+                tracing.tracer.cache_access(name, res is not MISSING)
+            if res is MISSING:
+                res = func(*args, **kwargs)
+                cache.put(key, res)
+            return res
+
+        wrapper.cache_clear = lambda: clear(name)
+        return wrapper
+
+    return decorator
@@ -0,0 +1,86 @@
+# coding: utf-8
+import dataclasses
+import itertools
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from expression import *
+
+
+@dataclasses.dataclass(frozen=True)
+class CompiledTerm:
+    term: Term
+    variables: Tuple[str, ...]
+    func: Callable[..., bool]
+    source: str
+
+    def __call__(self, *values: bool) -> bool:
+        return self.func(*values)
+
+    def evaluate(self, interp: Interpretation) -> bool:
+        if not all(name in interp.values for name in self.variables):
+            # the tree walk only raises for the unbound values it actually reaches
+            return self.term.evaluate(interp)
+        return self.func(*(interp.values[name] for name in self.variables))
+
+    def evaluate_many(self, rows: Iterable[Sequence[bool]]) -> Iterator[bool]:
+        return itertools.starmap(self.func, rows)
+
+
+def compile_term(term: Term, variables: Optional[Sequence[str]] = None) -> CompiledTerm:
+    """Compiles term into a straight-line Python function taking one positional argument per variable
+
+    Each distinct subterm is computed once, into its own local, in postorder."""
+    if variables is None:
+        variables = sorted({v.name for v in term.get_vars()})
+    slots = {name: f"v{i}" for i, name in enumerate(variables)}
+
+    names: Dict[Term, str] = {}
+    lines: List[str] = []
+    stack = [(term, False)]
+    while stack:
+        node, ready = stack.pop()
+        if node in names:
+            continue
+
+        if isinstance(node, Positive):
+            names[node] = "True"
+            continue
+        if isinstance(node, Negative):
+            names[node] = "False"
+            continue
+        if isinstance(node, NamedValue):
+            if node.name not in slots:
+                raise UnboundLocalError(f"Unbound value {node.name}")
+            names[node] = slots[node.name]
+            continue
+        if not isinstance(node, (Not, And, Or, Imp, Equ)):
+            raise NotImplementedError
+
+        args = node.get_args()
+        if not ready:
+            stack.append((node, True))
+            stack.extend((arg, False) for arg in args)
+            continue
+
+        args = [names[arg] for arg in args]
+        if isinstance(node, Not):
+            expr = f"not {args[0]}"
+        elif isinstance(node, And):
+            expr = " and ".join(args) or "True"
+        elif isinstance(node, Or):
+            expr = " or ".join(args) or "False"
+        elif isinstance(node, Imp):
+            expr = f"not {args[0]} or {args[1]}"
+        else:
+            expr = f"{args[0]} == {args[1]}"
+        names[node] = f"t{len(lines)}"
+        lines.append(f"    {names[node]} = {expr}")
+
+    source = "\n".join([
+        f"def evaluate({', '.join(slots.values())}):",
+        *lines,
+        f"    return {names[term]}"
+    ])
+    namespace = {}
+    exec(compile(source, "<compiled term>", "exec"), namespace)
+    return CompiledTerm(term, tuple(variables), namespace["evaluate"], source)
@@ -0,0 +1,321 @@
+# coding: utf-8
+import time
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from cache import cached
+from expression import *
+from rules import Ruleset, RULES_DNF, get_pattern_head
+
+# an e-node is a term whose children are e-classes: its type, its name or placeholder, and the ids of its children
+# (a frozenset for variadic operators, a tuple otherwise)
+ENode = Tuple[type, Optional[str], object]
+Match = Dict[Term, int]
+
+
+def is_placeholder(term: Term) -> bool:
+    return isinstance(term, Variable) and term.name[0] == "$"
+
+
+@cached("has_placeholders")
+def has_placeholders(term: Term) -> bool:
+    return any(map(is_placeholder, term.get_children()))
+
+
+def get_node_head(node: ENode):
+    cls, payload, _ = node
+    if issubclass(cls, (NamedValue, NamedPredicate)):
+        return cls, payload
+    return cls
+
+
+class EGraph:
+    """Equivalence classes of terms, closed under congruence
+
+    Rewrites only ever merge classes, so every form reached by the rules stays available to later matches."""
+
+    def __init__(self):
+        self.parents: List[int] = []
+        self.classes: Dict[int, Set[ENode]] = {}
+        self.memo: Dict[ENode, int] = {}
+        self.dirty = False
+        # node limit and deadline of the running saturation
+        self.limits: Tuple[Optional[int], Optional[float]] = None, None
+
+    def __len__(self):
+        return len(self.memo)
+
+    def find(self, i: int) -> int:
+        root = i
+        while self.parents[root] != root:
+            root = self.parents[root]
+        while self.parents[i] != root:
+            self.parents[i], i = root, self.parents[i]
+        return root
+
+    def union(self, a: int, b: int) -> int:
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return a
+        if len(self.classes[a]) < len(self.classes[b]):
+            a, b = b, a
+        self.parents[b] = a
+        self.classes[a] |= self.classes.pop(b)
+        self.dirty = True
+        return a
+
+    def canonicalize(self, node: ENode) -> ENode:
+        cls, payload, children = node
+        if isinstance(children, frozenset):
+            return cls, payload, frozenset(map(self.find, children))
+        return cls, payload, tuple(map(self.find, children))
+
+    def add_node(self, node: ENode) -> int:
+        cls, payload, children = node = self.canonicalize(node)
+        if issubclass(cls, VariadicOp):
+            # same flattening as the constructor, using the first node of the same operator in each child
+            flat = set()
+            for child in children:
+                inner = next((n for n in self.classes[child] if n[0] is cls), None)
+                flat.update(inner[2] if inner else (child,))
+            if len(flat) == 1:
+                return self.find(next(iter(flat)))
+            node = cls, payload, frozenset(flat)
+        if node in self.memo:
+            return self.find(self.memo[node])
+        i = len(self.parents)
+        self.parents.append(i)
+        self.classes[i] = {node}
+        self.memo[node] = i
+        return i
+
+    def add_term(self, term: Term) -> int:
+        ids: Dict[Term, int] = {}
+        stack = [(term, False)]
+        while stack:
+            t, ready = stack.pop()
+            if t in ids:
+                continue
+            children = self.get_term_children(t)
+            if not ready:
+                stack.append((t, True))
+                stack.extend((c, False) for c in children)
+                continue
+            ids[t] = self.add_node(self.get_term_node(t, [ids[c] for c in children]))
+        return self.find(ids[term])
+
+    @staticmethod
+    def get_term_children(term: Term) -> Tuple[Term, ...]:
+        if isinstance(term, Quantifier):
+            return term.var, term.expr
+        if isinstance(term, Predicate):
+            return tuple(term.get_args())
+        return ()
+
+    @staticmethod
+    def get_term_node(term: Term, children: List[int]) -> ENode:
+        if isinstance(term, VariadicOp):
+            return type(term), term.placeholder, frozenset(children)
+        if isinstance(term, (NamedValue, NamedPredicate)):
+            return type(term), term.name, tuple(children)
+        return type(term), None, tuple(children)
+
+    def lookup_term(self, term: Term) -> Optional[int]:
+        """Class of term if it is already in the graph, without adding it"""
+        children = []
+        for child in self.get_term_children(term):
+            if (i := self.lookup_term(child)) is None:
+                return None
+            children.append(i)
+        node = self.canonicalize(self.get_term_node(term, children))
+        return self.find(self.memo[node]) if node in self.memo else None
+
+    def rebuild(self):
+        """Restores congruence: nodes whose children were merged may now be equal"""
+        while self.dirty:
+            self.dirty = False
+            memo = {}
+            for i, nodes in list(self.classes.items()):
+                if self.find(i) != i:
+                    continue
+                for node in list(nodes):
+                    node = self.canonicalize(node)
+                    cls, _, children = node
+                    if issubclass(cls, VariadicOp) and len(children) == 1:
+                        self.union(i, next(iter(children)))
+                    if node in memo:
+                        self.union(memo[node], i)
+                    else:
+                        memo[node] = i
+            self.memo = {node: self.find(i) for node, i in memo.items()}
+            for i in list(self.classes):
+                if i in self.classes:
+                    self.classes[i] = {self.canonicalize(node) for node in self.classes[i]}
+
+    def match(self, pattern: Term, i: int, subst: Match) -> Iterator[Match]:
+        i = self.find(i)
+        if is_placeholder(pattern):
+            if pattern not in subst:
+                yield {**subst, pattern: i}
+            elif self.find(subst[pattern]) == i:
+                yield subst
+            return
+
+        if not has_placeholders(pattern):
+            if self.lookup_term(pattern) == i:
+                yield subst
+            return
+
+        for node in list(self.classes[i]):
+            cls, payload, children = node
+            if cls is not type(pattern):
+                continue
+            if isinstance(pattern, NamedPredicate):
+                if payload != pattern.name or len(children) != pattern.arity():
+                    continue
+                yield from self.match_all(list(pattern.args), list(children), subst)
+            elif isinstance(pattern, Quantifier):
+                # like unification, only the bodies are compared
+                yield from self.match(pattern.expr, children[1], subst)
+            elif isinstance(pattern, VariadicOp):
+                yield from self.match_variadic(pattern, children, subst)
+            else:
+                yield from self.match_all(list(pattern.get_args()), list(children), subst)
+
+    def match_all(self, patterns: List[Term], children: List[int], subst: Match) -> Iterator[Match]:
+        if not patterns:
+            yield subst
+            return
+        for sub in self.match(patterns[0], children[0], subst):
+            yield from self.match_all(patterns[1:], children[1:], sub)
+
+    def match_any(self, patterns: List[Term], children: List[int], subst: Match) -> Iterator[Match]:
+        """Matches each pattern with a distinct child, in any order"""
+        if not patterns:
+            yield subst
+            return
+        for k, child in enumerate(children):
+            for sub in self.match(patterns[0], child, subst):
+                yield from self.match_any(patterns[1:], children[:k] + children[k + 1:], sub)
+
+    def match_variadic(self, pattern: VariadicOp, children: frozenset, subst: Match) -> Iterator[Match]:
+        patterns = list(pattern.args)
+        children = list(children)
+        if len(patterns) == len(children):
+            yield from self.match_any(patterns, children, subst)
+        elif pattern.placeholder == "*" and len(patterns) < len(children):
+            # one placeholder takes all the children that the other arguments don't match
+            for rest in filter(is_placeholder, patterns):
+                others = [p for p in patterns if p is not rest]
+                for sub, used in self.match_some(others, children, subst):
+                    if self.has_expired():
+                        return
+                    group = self.add_node((type(pattern), "", frozenset(c for c in children if c not in used)))
+                    yield from self.match(rest, group, sub)
+
+    def match_some(self, patterns: List[Term], children: List[int], subst: Match,
+                   used: frozenset = frozenset()) -> Iterator[Tuple[Match, frozenset]]:
+        """Matches each pattern with a distinct child, yielding the children used along with the substitution"""
+        if not patterns:
+            yield subst, used
+            return
+        for child in children:
+            if child in used:
+                continue
+            for sub in self.match(patterns[0], child, subst):
+                yield from self.match_some(patterns[1:], children, sub, used | {child})
+
+    def instantiate(self, term: Term, subst: Match) -> int:
+        if term in subst:
+            return self.find(subst[term])
+        children = [self.instantiate(c, subst) for c in self.get_term_children(term)]
+        return self.add_node(self.get_term_node(term, children))
+
+    def has_expired(self) -> bool:
+        """Whether the node or time limit of the current saturation has been passed"""
+        node_limit, deadline = self.limits
+        return (node_limit is not None and len(self) > node_limit or
+                deadline is not None and time.monotonic() > deadline)
+
+    def saturate(self, rules: Ruleset = RULES_DNF, iter_limit: int = 30, node_limit: int = 10000,
+                 time_limit: Optional[float] = None) -> bool:
+        """Applies the rules until nothing changes or a limit is reached, returns whether it saturated"""
+        self.limits = node_limit, None if time_limit is None else time.monotonic() + time_limit
+        try:
+            for _ in range(iter_limit):
+                heads = {}
+                for i, nodes in self.classes.items():
+                    for node in nodes:
+                        heads.setdefault(get_node_head(node), set()).add(i)
+                # matching variadic patterns adds nodes too
+                size = len(self)
+                matches = []
+                for src, dest in rules.items():
+                    head = get_pattern_head(src)
+                    for i in list(self.classes if head is None else heads.get(head, ())):
+                        for sub in self.match(src, i, {}):
+                            matches.append((i, dest, sub))
+                            if self.has_expired():
+                                break
+                        if self.has_expired():
+                            self.rebuild()
+                            return False
+
+                for i, dest, sub in matches:
+                    self.union(i, self.instantiate(dest, sub))
+                    if self.has_expired():
+                        self.rebuild()
+                        return False
+                changed = self.dirty or len(self) != size
+                self.rebuild()
+                if not changed:
+                    return True
+                if self.has_expired():
+                    return False
+            return False
+        finally:
+            self.limits = None, None
+
+    def extract(self, i: int) -> Term:
+        """Smallest term of a class, by number of nodes"""
+        costs: Dict[int, Tuple[int, ENode]] = {}
+        changed = True
+        while changed:
+            changed = False
+            for c, nodes in self.classes.items():
+                for node in nodes:
+                    children = node[2]
+                    if not all(self.find(k) in costs for k in children):
+                        continue
+                    cost = 1 + sum(costs[self.find(k)][0] for k in children)
+                    if c not in costs or cost < costs[c][0]:
+                        costs[c] = cost, node
+                        changed = True
+
+        terms: Dict[int, Term] = {}
+
+        def build(c: int) -> Term:
+            c = self.find(c)
+            if c not in terms:
+                cls, payload, children = costs[c][1]
+                args = [build(k) for k in children]
+                if issubclass(cls, VariadicOp):
+                    terms[c] = cls(args, payload)
+                elif issubclass(cls, NamedValue):
+                    terms[c] = cls(payload)
+                elif issubclass(cls, NamedPredicate):
+                    terms[c] = cls(payload, tuple(args))
+                elif issubclass(cls, BinOp):
+                    terms[c] = cls(args)
+                else:
+                    terms[c] = cls(*args)
+            return terms[c]
+
+        return build(i)
+
+
+def simplify(term: Term, rules: Ruleset = RULES_DNF, iter_limit: int = 30, node_limit: int = 10000,
+             time_limit: Optional[float] = None) -> Term:
+    graph = EGraph()
+    root = graph.add_term(term)
+    graph.saturate(rules, iter_limit, node_limit, time_limit)
+    return graph.extract(root)
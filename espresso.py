@@ -0,0 +1,304 @@
+# coding: utf-8
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from bdd import BDD, FALSE, TRUE
+from expression import Term, Literal, Positive, NamedValue, Not, VariadicOp, And, BinOp, Imp, Equ
+from qmc import named, to_term
+from truth_table import TruthTable
+
+# a cube is a product of literals, given as the bits of the variables appearing positively and negatively in it
+# the first variable is the most significant bit, like qmc
+Cube = Tuple[int, int]
+Cover = List[Cube]
+
+UNIVERSE: Cube = (0, 0)
+
+# largest cover built by distributing the products of a term, before falling back to a decision diagram
+MAX_CUBES = 1024
+# default time limit of execute, in seconds
+TIME_LIMIT = 10.0
+
+
+def get_literals(c: Cube) -> int:
+    return c[0] | c[1]
+
+
+def get_literal_count(c: Cube) -> int:
+    return bin(c[0] | c[1]).count("1")
+
+
+def intersects(a: Cube, b: Cube) -> bool:
+    return not (a[0] & b[1] or a[1] & b[0])
+
+
+def contains(a: Cube, b: Cube) -> bool:
+    return not (a[0] & ~b[0] or a[1] & ~b[1])
+
+
+def get_cost(cover: Cover) -> Tuple[int, int]:
+    return len(cover), sum(map(get_literal_count, cover))
+
+
+def scc(cover: Cover) -> Cover:
+    """Single cube containment: drops the cubes contained in another one"""
+    res = []
+    for c in sorted(set(cover), key=get_literal_count):
+        if not any(contains(d, c) for d in res):
+            res.append(c)
+    return res
+
+
+def product(f: Cover, g: Cover) -> Cover:
+    return scc([(a[0] | b[0], a[1] | b[1]) for a in f for b in g if intersects(a, b)])
+
+
+def cofactor(cover: Cover, c: Cube) -> Cover:
+    lits = ~get_literals(c)
+    return [(d[0] & lits, d[1] & lits) for d in cover if intersects(d, c)]
+
+
+def has_expired(deadline: Optional[float]) -> bool:
+    return deadline is not None and time.monotonic() > deadline
+
+
+def is_tautology(cover: Cover, deadline: Optional[float] = None) -> bool:
+    """Whether the cubes cover the whole space; once the deadline has passed, False, which keeps callers on the safe
+    side"""
+    while True:
+        if has_expired(deadline):
+            return False
+        if UNIVERSE in cover:
+            return True
+        if not cover:
+            return False
+        # the cubes can't be a tautology if they don't have enough minterms between them
+        counts = [get_literal_count(c) for c in cover]
+        most = max(counts)
+        if sum(1 << (most - n) for n in counts) < 1 << most:
+            return False
+        ones = zeros = 0
+        for c in cover:
+            ones |= c[0]
+            zeros |= c[1]
+        binate = ones & zeros
+        unate = (ones | zeros) & ~binate
+        if not unate:
+            break
+        # the cubes with a unate literal can't help cover the other half of the space
+        cover = [c for c in cover if not get_literals(c) & unate]
+
+    # split on the most binate variable
+    counts: Dict[int, int] = {}
+    for c in cover:
+        lits = get_literals(c) & binate
+        while lits:
+            bit = lits & -lits
+            counts[bit] = counts.get(bit, 0) + 1
+            lits ^= bit
+    bit = max(counts, key=counts.get)
+    return is_tautology(cofactor(cover, (bit, 0)), deadline) and is_tautology(cofactor(cover, (0, bit)), deadline)
+
+
+def covers(cover: Cover, c: Cube, deadline: Optional[float] = None) -> bool:
+    return is_tautology(cofactor(cover, c), deadline)
+
+
+def expand(f: Cover, dc: Cover, deadline: Optional[float] = None) -> Cover:
+    f = sorted(f, key=get_literal_count)
+    res = []
+    for i, c in enumerate(f):
+        if any(contains(d, c) for d in res):
+            continue
+        if has_expired(deadline):
+            # the rest as is, without the quadratic containment checks
+            return res + f[i:]
+        care = res + f[i:] + dc
+        lits = get_literals(c)
+        for b in range(lits.bit_length()):
+            bit = 1 << b
+            if not lits & bit:
+                continue
+            bigger = (c[0] & ~bit, c[1] & ~bit)
+            if covers(care, bigger, deadline):
+                c = bigger
+        res.append(c)
+    return scc(res)
+
+
+def irredundant(f: Cover, dc: Cover, deadline: Optional[float] = None) -> Cover:
+    res = list(f)
+    for c in sorted(f, key=get_literal_count, reverse=True):
+        if has_expired(deadline):
+            break
+        rest = [d for d in res if d != c]
+        if covers(rest + dc, c, deadline):
+            res = rest
+    return res
+
+
+def reduce(f: Cover, dc: Cover, bits: int, deadline: Optional[float] = None) -> Cover:
+    res = list(f)
+    for i, c in enumerate(res):
+        if has_expired(deadline):
+            break
+        rest = [d for d in res[:i] + res[i + 1:] if d is not None] + dc
+        if covers(rest, c, deadline):
+            res[i] = None
+            continue
+        for b in range(bits):
+            bit = 1 << b
+            if get_literals(c) & bit:
+                continue
+            # c can lose the half where the variable has one value if the rest of the cover already has it
+            if covers(rest, (c[0], c[1] | bit), deadline):
+                c = (c[0] | bit, c[1])
+            elif covers(rest, (c[0] | bit, c[1]), deadline):
+                c = (c[0], c[1] | bit)
+        res[i] = c
+    return [c for c in res if c is not None]
+
+
+def minimize(on: Cover, dc: Cover, bits: int, max_iterations: int = 16, time_limit: Optional[float] = None,
+             deadline: Optional[float] = None) -> Cover:
+    if time_limit is not None:
+        deadline = time.monotonic() + time_limit
+    best = irredundant(expand(on, dc, deadline), dc, deadline)
+    for _ in range(max_iterations):
+        if has_expired(deadline):
+            break
+        f = irredundant(expand(reduce(best, dc, bits, deadline), dc, deadline), dc, deadline)
+        if get_cost(f) >= get_cost(best):
+            break
+        best = f
+    return best
+
+
+def get_path_cover(bdd: BDD, u: int, positions: Dict[str, int], positive: bool = True, max_cubes: int = MAX_CUBES,
+                   deadline: Optional[float] = None) -> Optional[Cover]:
+    """Cover of u (or of its negation) made of the paths of the diagram to the terminal, which are disjoint cubes, or
+    None if there are more than max_cubes of them or the deadline passes first"""
+    target = TRUE if positive else FALSE
+    res = []
+    stack = [(u, 0, 0)]
+    while stack:
+        if has_expired(deadline):
+            return None
+        v, ones, zeros = stack.pop()
+        if v <= TRUE:
+            if v == target:
+                res.append((ones, zeros))
+                if len(res) > max_cubes:
+                    return None
+            continue
+        lvl, low, high = bdd.nodes[v]
+        bit = positions[bdd.variables[lvl]]
+        stack.append((low, ones, zeros | bit))
+        stack.append((high, ones | bit, zeros))
+    return res
+
+
+def to_cover(source: Union[Term, TruthTable], positions: Dict[str, int], positive: bool = True,
+             max_cubes: int = MAX_CUBES, deadline: Optional[float] = None) -> Optional[Cover]:
+    """Cover of source (or of its negation), with each variable at the given bit, or None if it has more than max_cubes
+    cubes or the deadline passes first
+
+    Terms are expanded directly, unless a product grows past max_cubes: the cover is then read off a decision diagram
+    of the term instead, which avoids the blowup of distributing products (e.g. on CNF). Truth tables are already
+    in memory, and give one cube per row whatever their count."""
+    if isinstance(source, TruthTable):
+        bits = [positions[name] for name in reversed(source.variables)]
+        full = sum(bits)
+        column = source.get_column()
+        rows = np.flatnonzero(column if positive else ~column)
+        cubes = []
+        for row in map(int, rows):
+            ones = sum(bit for i, bit in enumerate(bits) if row >> i & 1)
+            cubes.append((ones, full & ~ones))
+        return cubes
+
+    res = expand_term(source, positions, positive, max_cubes, deadline)
+    if res is None and not has_expired(deadline):
+        bdd = BDD(sorted(positions, key=positions.get, reverse=True))
+        u = bdd.from_term(source, deadline)
+        res = None if u is None else get_path_cover(bdd, u, positions, positive, max_cubes, deadline)
+    return res
+
+
+def expand_term(term: Term, positions: Dict[str, int], positive: bool, max_cubes: int,
+                deadline: Optional[float]) -> Optional[Cover]:
+    """Cover of term by distributing the products, or None if it gets too large or the deadline passes"""
+    def bounded_product(f: Optional[Cover], g: Optional[Cover]) -> Optional[Cover]:
+        if f is None or g is None or len(f) * len(g) > max_cubes:
+            return None
+        return product(f, g)
+
+    def union(*covers: Optional[Cover]) -> Optional[Cover]:
+        if any(c is None for c in covers):
+            return None
+        return scc([c for cover in covers for c in cover])
+
+    def walk(t: Term, positive: bool) -> Optional[Cover]:
+        if has_expired(deadline):
+            return None
+        if isinstance(t, Literal):
+            return [UNIVERSE] if isinstance(t, Positive) == positive else []
+        if isinstance(t, NamedValue):
+            bit = positions[t.name]
+            return [(bit, 0) if positive else (0, bit)]
+        if isinstance(t, Not):
+            return walk(t.elem, not positive)
+        if isinstance(t, VariadicOp):
+            args = [walk(arg, positive) for arg in t.args]
+            if isinstance(t, And) == positive:
+                res = [UNIVERSE]
+                for arg in args:
+                    res = bounded_product(res, arg)
+                return res
+            return union(*args)
+        if isinstance(t, BinOp):
+            left, right = t.get_left(), t.get_right()
+            if isinstance(t, Imp):
+                if positive:
+                    return union(walk(left, False), walk(right, True))
+                return bounded_product(walk(left, True), walk(right, False))
+            if isinstance(t, Equ):
+                return union(bounded_product(walk(left, True), walk(right, positive)),
+                             bounded_product(walk(left, False), walk(right, not positive)))
+        raise NotImplementedError
+
+    return walk(term, positive)
+
+
+def execute(source: Union[Term, TruthTable], dont_care: Union[Term, TruthTable, None] = None,
+            max_iterations: int = 16, time_limit: Optional[float] = TIME_LIMIT, max_cubes: int = MAX_CUBES) -> Term:
+    """Near-minimal sum of products for source, heuristically minimized by expand, irredundant and reduce passes
+
+    A term whose cover has more than max_cubes cubes, or that can't be minimized within the time limit, is returned
+    as is."""
+    variables = {}
+    for arg in (source, dont_care):
+        if isinstance(arg, TruthTable):
+            variables.update((name, named(name)) for name in arg.variables)
+        elif arg is not None:
+            variables.update((v.name, v) for v in arg.get_vars())
+    names = sorted(variables)
+    bits = len(names)
+    positions = {name: 1 << (bits - 1 - i) for i, name in enumerate(names)}
+
+    # the time limit covers the conversion as well
+    deadline = None if time_limit is None else time.monotonic() + time_limit
+    on = to_cover(source, positions, max_cubes=max_cubes, deadline=deadline)
+    if on is None:
+        return source
+    # fewer don't cares only make the result less minimal
+    dc = (to_cover(dont_care, positions, max_cubes=max_cubes, deadline=deadline) or []) if dont_care is not None else []
+    cover = minimize(on, dc, bits, max_iterations, deadline=deadline)
+    # an unminimized cover is no better than the source, and can be much larger
+    if has_expired(deadline) and isinstance(source, Term):
+        return source
+
+    full = (1 << bits) - 1
+    return to_term([variables[name] for name in names], ((c[0], full & ~get_literals(c)) for c in cover))
@@ -1,8 +1,8 @@
 # coding: utf-8
-from abc import ABC, abstractmethod
+from abc import ABC, ABCMeta, abstractmethod
 import dataclasses
-from functools import reduce
-from typing import Dict, Tuple, Iterable, Generator, Set, Callable
+import weakref
+from typing import Any, Dict, Tuple, Iterable, Generator, Set, Callable, Union
 
 
 @dataclasses.dataclass
@@ -13,64 +13,207 @@ class Interpretation:
         return {Variable(name): (Negative, Positive)[val]() for name, val in self.values.items()}
 
 
-@dataclasses.dataclass(frozen=True)
-class Term(ABC):
+class TermMeta(ABCMeta):
+    """Hash-conses terms: building a term structurally equal to a live one returns the existing object
+
+    Equality of terms is therefore identity, and so is their hash. The table of live terms is keyed by the hash of the
+    class and field values, so an entry is only a weak reference (or a tuple of them on a collision), and the
+    constructor arguments are looked up before any object is built."""
+    fields: Dict[type, Tuple[str, ...]] = {}
+    defaults: Dict[type, Tuple[Any, ...]] = {}
+    # fields holding subterms, with whether they hold a collection of them
+    child_fields: Dict[type, Tuple[Tuple[str, bool], ...]] = {}
+    terms: Dict[int, Union[weakref.KeyedRef, Tuple[weakref.KeyedRef, ...]]] = {}
+
+    def __call__(cls, *args, **kwargs):
+        if cls not in TermMeta.fields:
+            TermMeta.fields[cls] = tuple(f.name for f in dataclasses.fields(cls))
+            TermMeta.defaults[cls] = tuple(f.default for f in dataclasses.fields(cls))
+        values = cls.get_values(*args, **kwargs)
+        key = hash((cls, *values))
+        entry = TermMeta.terms.get(key)
+        refs = () if entry is None else entry if type(entry) is tuple else (entry,)
+        for ref in refs:
+            term = ref()
+            if type(term) is cls and all(getattr(term, name) == value
+                                         for name, value in zip(TermMeta.fields[cls], values)):
+                return term
+
+        term = cls.__new__(cls)
+        for name, value in zip(TermMeta.fields[cls], values):
+            object.__setattr__(term, name, value)
+        if cls not in TermMeta.child_fields:
+            TermMeta.child_fields[cls] = tuple((name, not isinstance(value, Term))
+                                               for name, value in zip(TermMeta.fields[cls], values)
+                                               if isinstance(value, (Term, tuple, frozenset)))
+        ref = weakref.KeyedRef(term, remove_term, key)
+        refs = tuple(r for r in refs if r() is not None)
+        TermMeta.terms[key] = (*refs, ref) if refs else ref
+        return term
+
+
+def remove_term(ref: weakref.KeyedRef, terms=TermMeta.terms):
+    """Drops the entry of a term that was collected"""
+    entry = terms.get(ref.key)
+    if entry is ref:
+        del terms[ref.key]
+    elif type(entry) is tuple:
+        rest = tuple(r for r in entry if r is not ref)
+        terms[ref.key] = rest if len(rest) > 1 else rest[0]
+
+
+@dataclasses.dataclass(frozen=True, eq=False)
+class Term(metaclass=TermMeta):
+    # _size, _depth and _vars stay unset until they are first asked for, so terms that are never measured don't
+    # allocate them; the hash is the default identity one, since equal terms are the same object
+    __slots__ = ("_size", "_depth", "_vars", "__weakref__")
+
+    @classmethod
+    def get_values(cls, *args, **kwargs) -> Tuple[Any, ...]:
+        """Values of the fields of the term built from these constructor arguments, in the order of the fields"""
+        names, defaults = TermMeta.fields[cls], TermMeta.defaults[cls]
+        if not kwargs and len(args) == len(names):
+            return args
+        values = args + tuple(kwargs.pop(name) if name in kwargs else default
+                              for name, default in zip(names[len(args):], defaults[len(args):]))
+        if kwargs or len(values) != len(names) or any(v is dataclasses.MISSING for v in values):
+            raise TypeError(f"Invalid arguments for {cls.__name__}")
+        return values
+
+    def __reduce__(self):
+        return type(self), tuple(getattr(self, f.name) for f in dataclasses.fields(self))
+
     def evaluate(self, interp: Interpretation) -> bool:
         raise NotImplementedError
 
+    def get_child_terms(self) -> Tuple["Term", ...]:
+        """Direct subterms, in the order of the fields"""
+        res = ()
+        for name, many in TermMeta.child_fields[type(self)]:
+            val = getattr(self, name)
+            res += tuple(val) if many else (val,)
+        return res
+
     def get_children(self) -> Generator["Term", None, None]:
-        yield self
-        for f in dataclasses.fields(self):
-            val = getattr(self, f.name)
-            if isinstance(val, Term):
-                yield from val.get_children()
-            elif isinstance(val, (tuple, frozenset)):
-                for item in val:
-                    yield from item.get_children()
+        """Every node of the tree, self first, depth-first in the order of the fields"""
+        stack = [self]
+        while stack:
+            term = stack.pop()
+            yield term
+            stack.extend(reversed(term.get_child_terms()))
+
+    def get_size(self) -> int:
+        """Number of nodes of the tree, counting a shared subterm once per occurrence"""
+        try:
+            return self._size
+        except AttributeError:
+            self.count_nodes()
+            return self._size
+
+    def get_depth(self) -> int:
+        try:
+            return self._depth
+        except AttributeError:
+            self.count_nodes()
+            return self._depth
+
+    def count_nodes(self):
+        """Caches the size and depth of every subterm that doesn't have them yet"""
+        stack = [(self, False)]
+        while stack:
+            term, ready = stack.pop()
+            if hasattr(term, "_size"):
+                continue
+            children = term.get_child_terms()
+            if ready:
+                object.__setattr__(term, "_size", 1 + sum(c._size for c in children))
+                object.__setattr__(term, "_depth", 1 + max((c._depth for c in children), default=0))
+            else:
+                stack.append((term, True))
+                stack.extend((c, False) for c in children if not hasattr(c, "_size"))
 
     def get_vars(self) -> Set["NamedValue"]:
-        return set(v for v in self.get_children() if isinstance(v, NamedValue))
+        """A copy of the cached set, which callers are free to modify"""
+        if not hasattr(self, "_vars"):
+            stack = [(self, False)]
+            while stack:
+                term, ready = stack.pop()
+                if hasattr(term, "_vars"):
+                    continue
+                children = term.get_child_terms()
+                if ready:
+                    res = frozenset((term,)) if isinstance(term, NamedValue) else frozenset()
+                    object.__setattr__(term, "_vars", res.union(*(c._vars for c in children)))
+                else:
+                    stack.append((term, True))
+                    stack.extend((c, False) for c in children if not hasattr(c, "_vars"))
+        return set(self._vars)
 
     def is_atomic(self) -> bool:
         return isinstance(self, (Literal, NamedValue))
 
     def map_fields(self, func: Callable[["Term"], "Term"]) -> "Term":
+        """Applies func to the direct subterms; returns self if none of them changed"""
         edits = {}
-        for field in dataclasses.fields(self):
-            val = getattr(self, field.name)
-            if isinstance(val, Term):
-                edits[field.name] = func(val)
-            elif isinstance(val, tuple):
-                edits[field.name] = tuple(func(v) for v in val)
-            elif isinstance(val, frozenset):
-                edits[field.name] = frozenset(func(v) for v in val)
-        return dataclasses.replace(self, **edits)
+        for name, many in TermMeta.child_fields[type(self)]:
+            val = getattr(self, name)
+            if not many:
+                new = func(val)
+                if new is not val:
+                    edits[name] = new
+                continue
+            items = [func(v) for v in val]
+            if any(new is not old for new, old in zip(items, val)):
+                edits[name] = type(val)(items)
+        return dataclasses.replace(self, **edits) if edits else self
 
     def apply_sub(self, find: "Term", replace: "Term") -> "Term":
-        if self == find:
-            return replace
-
-        return self.map_fields(lambda val: val.apply_sub(find, replace))
+        return self.apply_subs({find: replace})
 
     def apply_subs(self, subs: "Unification") -> "Term":
-        return reduce(
-            lambda cur, sub: cur.apply_sub(*sub),
-            subs.items(),
-            self)
+        """Replaces all the keys of subs at once, in a single walk: the replacements aren't substituted again
+
+        Shared subterms are rebuilt only once, and the subtrees that contain no key are returned as is."""
+        if not subs:
+            return self
+        memo = dict(subs)
+        stack = [(self, False)]
+        while stack:
+            term, ready = stack.pop()
+            if term in memo:
+                continue
+            if ready:
+                memo[term] = term.map_fields(memo.__getitem__)
+                continue
+            children = term.get_child_terms()
+            if not children:
+                memo[term] = term
+                continue
+            stack.append((term, True))
+            stack.extend((c, False) for c in children if c not in memo)
+        return memo[self]
 
     def get_truth_table(self):
         from truth_table import TruthTable
         return TruthTable.from_term(self)
 
+    def compile(self):
+        from compiler import compile_term
+        return compile_term(self)
+
 
 class Literal(Term, ABC):
+    __slots__ = ()
+
     @staticmethod
     def from_bool(val: bool) -> "Literal":
         return (Negative, Positive)[val]()
 
 
-@dataclasses.dataclass(frozen=True)
+@dataclasses.dataclass(frozen=True, eq=False)
 class Positive(Literal):
+    __slots__ = ()
+
     def __str__(self):
         return "TRUE"
 
@@ -78,8 +221,10 @@ class Positive(Literal):
         return True
 
 
-@dataclasses.dataclass(frozen=True)
+@dataclasses.dataclass(frozen=True, eq=False)
 class Negative(Literal):
+    __slots__ = ()
+
     def __str__(self):
         return "FALSE"
 
@@ -87,8 +232,10 @@ class Negative(Literal):
         return False
 
 
-@dataclasses.dataclass(frozen=True)
+@dataclasses.dataclass(frozen=True, eq=False)
 class NamedValue(Term):
+    __slots__ = ("name",)
+
     name: str
 
     def __str__(self):
@@ -100,17 +247,19 @@ class NamedValue(Term):
         return interp.values[self.name]
 
 
-@dataclasses.dataclass(frozen=True)
+@dataclasses.dataclass(frozen=True, eq=False)
 class Variable(NamedValue):
-    pass
+    __slots__ = ()
 
 
-@dataclasses.dataclass(frozen=True)
+@dataclasses.dataclass(frozen=True, eq=False)
 class Constant(NamedValue):
-    pass
+    __slots__ = ()
 
 
 class Predicate(Term, ABC):
+    __slots__ = ()
+
     @abstractmethod
     def get_args(self) -> Tuple[Term, ...]:
         raise NotImplementedError
@@ -122,8 +271,10 @@ class Predicate(Term, ABC):
         return len(self.get_args())
 
 
-@dataclasses.dataclass(frozen=True)
+@dataclasses.dataclass(frozen=True, eq=False)
 class NamedPredicate(Predicate):
+    __slots__ = ("name", "args")
+
     name: str
     args: Tuple[Term, ...]
 
@@ -137,8 +288,10 @@ class NamedPredicate(Predicate):
         return f"{self.name}({', '.join(map(str, self.args))})"
 
 
-@dataclasses.dataclass(frozen=True)
+@dataclasses.dataclass(frozen=True, eq=False)
 class BuiltinOp(Predicate, ABC):
+    __slots__ = ("args",)
+
     args: Tuple[Term, ...]
 
     @staticmethod
@@ -152,19 +305,21 @@ class BuiltinOp(Predicate, ABC):
         return self.args
 
 
-@dataclasses.dataclass(frozen=True)
+@dataclasses.dataclass(frozen=True, eq=False)
 class VariadicOp(BuiltinOp, ABC):
+    __slots__ = ("placeholder",)
+
     placeholder: str
 
-    def __init__(self, args: Iterable[Term], placeholder: str = ""):
+    @classmethod
+    def get_values(cls, args: Iterable[Term], placeholder: str = "") -> Tuple[Any, ...]:
         nargs = []
         for arg in args:
-            if type(arg) == type(self):
+            if type(arg) == cls:
                 nargs.extend(arg.args)
             else:
                 nargs.append(arg)
-        self.__dict__["args"] = frozenset(nargs)
-        self.__dict__["placeholder"] = placeholder
+        return frozenset(nargs), placeholder
 
     def commutes(self) -> bool:
         return True
@@ -173,8 +328,10 @@ class VariadicOp(BuiltinOp, ABC):
         return "(" + f" {self.get_op() + self.placeholder} ".join(map(str, self.args)) + ")"
 
 
-@dataclasses.dataclass(frozen=True, init=False)
+@dataclasses.dataclass(frozen=True, init=False, eq=False)
 class And(VariadicOp):
+    __slots__ = ()
+
     @staticmethod
     def get_op():
         return "&"
@@ -186,8 +343,10 @@ class And(VariadicOp):
         return True
 
 
-@dataclasses.dataclass(frozen=True, init=False)
+@dataclasses.dataclass(frozen=True, init=False, eq=False)
 class Or(VariadicOp):
+    __slots__ = ()
+
     @staticmethod
     def get_op():
         return "|"
@@ -199,10 +358,13 @@ class Or(VariadicOp):
         return False
 
 
-@dataclasses.dataclass(frozen=True)
+@dataclasses.dataclass(frozen=True, eq=False)
 class BinOp(BuiltinOp, ABC):
-    def __init__(self, args: Iterable[Term], op: str = None):
-        self.__dict__["args"] = tuple(args)
+    __slots__ = ()
+
+    @classmethod
+    def get_values(cls, args: Iterable[Term], op: str = None) -> Tuple[Any, ...]:
+        return tuple(args),
 
     def get_left(self):
         return self.args[0]
@@ -211,8 +373,10 @@ class BinOp(BuiltinOp, ABC):
         return self.args[1]
 
 
-@dataclasses.dataclass(frozen=True, init=False)
+@dataclasses.dataclass(frozen=True, init=False, eq=False)
 class Imp(BinOp):
+    __slots__ = ()
+
     @staticmethod
     def get_op():
         return "→"
@@ -221,8 +385,10 @@ class Imp(BinOp):
         return not self.get_left().evaluate(interp) or self.get_right().evaluate(interp)
 
 
-@dataclasses.dataclass(frozen=True, init=False)
+@dataclasses.dataclass(frozen=True, init=False, eq=False)
 class Equ(BinOp):
+    __slots__ = ()
+
     @staticmethod
     def get_op():
         return "↔"
@@ -231,8 +397,10 @@ class Equ(BinOp):
         return self.get_left().evaluate(interp) == self.get_right().evaluate(interp)
 
 
-@dataclasses.dataclass(frozen=True)
+@dataclasses.dataclass(frozen=True, eq=False)
 class Not(Predicate):
+    __slots__ = ("elem",)
+
     elem: Term
 
     def __str__(self):
@@ -245,8 +413,10 @@ class Not(Predicate):
         return self.elem,
 
 
-@dataclasses.dataclass(frozen=True)
+@dataclasses.dataclass(frozen=True, eq=False)
 class Quantifier(Term, ABC):
+    __slots__ = ("var", "expr")
+
     var: Variable
     expr: Term
 
@@ -258,15 +428,19 @@ class Quantifier(Term, ABC):
         return f"{self.get_symbol()}{self.var} ({self.expr})"
 
 
-@dataclasses.dataclass(frozen=True, init=False)
+@dataclasses.dataclass(frozen=True, init=False, eq=False)
 class Universal(Quantifier):
+    __slots__ = ()
+
     @staticmethod
     def get_symbol():
         return "∀"
 
 
-@dataclasses.dataclass(frozen=True, init=False)
+@dataclasses.dataclass(frozen=True, init=False, eq=False)
 class Existential(Quantifier):
+    __slots__ = ()
+
     @staticmethod
     def get_symbol():
         return "∃"
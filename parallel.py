@@ -0,0 +1,24 @@
+# coding: utf-8
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator, Optional, Sequence
+
+
+def map_ordered(func: Callable, tasks: Iterable[Sequence], workers: int, initializer: Optional[Callable] = None,
+                initargs: Sequence = ()) -> Iterator:
+    """Results of func called with the arguments of each task, in order, computed by a process pool
+
+    Tasks are only taken from the iterable as the pool catches up, at most two per worker at a time, so that memory
+    stays bounded; the pending ones are cancelled if the consumer stops early."""
+    pool = ProcessPoolExecutor(workers, initializer=initializer, initargs=initargs)
+    try:
+        tasks = iter(tasks)
+        pending = deque(pool.submit(func, *args) for args in itertools.islice(tasks, 2 * workers))
+        while pending:
+            future = pending.popleft()
+            for args in itertools.islice(tasks, 1):
+                pending.append(pool.submit(func, *args))
+            yield future.result()
+    finally:
+        pool.shutdown(cancel_futures=True)
@@ -1,7 +1,11 @@
 # coding: utf-8
-from typing import List, Optional
+import itertools
+import mmap
+from functools import lru_cache
+from typing import Dict, IO, Iterable, Iterator, List, Optional, Tuple, Union
 
 from expression import *
+from parallel import map_ordered
 
 NEGATION = "!"
 BINOPS = {
@@ -40,6 +44,7 @@ class Token:
 
     val: str
     type: int
+    pos: int = 0
 
 
 CHAR_LUT = {
@@ -65,109 +70,244 @@ def apply_lut(s: str, lut) -> str:
     return s
 
 
-def tokenize(expr: str) -> List[Token]:
-    expr = apply_lut(expr, CHAR_LUT)
+def get_aliases(lut) -> Dict[str, str]:
+    """Strings that apply_lut turns into a single operator
 
-    tokens = []
+    Since the replacements are chained, this includes the aliases where an operator is itself written with one of its
+    aliases, like <-> for <→."""
+    aliases = {k: v for keys, v in lut.items() for k in ([keys] if type(keys) == str else keys)}
+    for alias, op in list(aliases.items()):
+        for i, c in enumerate(alias):
+            for other, val in list(aliases.items()):
+                variant = alias[:i] + other + alias[i + 1:]
+                if val == c and variant not in aliases and apply_lut(variant, lut) == op:
+                    aliases[variant] = op
+    return aliases
+
+
+def make_trie(aliases: Dict[str, str]) -> dict:
+    """Nested dicts by character, the operator of a complete alias being under the key None"""
+    trie = {}
+    for alias, op in aliases.items():
+        node = trie
+        for c in alias:
+            node = node.setdefault(c, {})
+        node[None] = op
+    return trie
+
+
+ALIASES = make_trie(get_aliases(CHAR_LUT))
+
+
+def match_alias(expr: str, pos: int) -> Optional[Tuple[str, int]]:
+    """Operator of the longest alias starting at pos, and the length of the alias"""
+    node = ALIASES
+    res = None
+    for i in range(pos, len(expr)):
+        node = node.get(expr[i])
+        if node is None:
+            break
+        if None in node:
+            res = node[None], i + 1 - pos
+    return res
 
+
+@lru_cache(maxsize=4096)
+def get_name(name: str) -> str:
+    return apply_lut(name, STR_LUT)
+
+
+def tokenize(expr: str) -> List[Token]:
+    """Splits expr in a single pass, the aliases of the operators being replaced as they are read"""
+    tokens = []
+    ops = set(OPS)
+    n = len(expr)
     pos = 0
-    while pos < len(expr):
+    while pos < n:
         cur = expr[pos]
-        lg = 1
-        if not cur.isspace():
-            if cur in OPS:
-                token_type = Token.OP
-            else:
-                npos = pos + 1
-                while npos < len(expr) and expr[npos] not in OPS and not expr[npos].isspace():
-                    npos += 1
-                lg = npos - pos
-                token_type = Token.VAR
-            tokens.append(Token(apply_lut(expr[pos:pos + lg], STR_LUT), token_type))
-        pos += lg
+        if cur.isspace():
+            pos += 1
+            continue
+        alias = cur in ALIASES and match_alias(expr, pos)
+        if alias:
+            tokens.append(Token(alias[0], Token.OP, pos))
+            pos += alias[1]
+        elif cur in ops:
+            tokens.append(Token(cur, Token.OP, pos))
+            pos += 1
+        else:
+            npos = pos + 1
+            while npos < n:
+                cur = expr[npos]
+                if cur in ops or cur.isspace() or cur in ALIASES and match_alias(expr, npos):
+                    break
+                npos += 1
+            tokens.append(Token(get_name(expr[pos:npos]), Token.VAR, pos))
+            pos = npos
     return tokens
 
 
+@lru_cache(maxsize=4096)
+def get_atom(name: str) -> Term:
+    return Constant(name) if name[0].islower() else Variable(name)
+
+
+# binding power of the binary operators, the first ones binding tighter
+LEVELS = {op: i for i, op in enumerate(BINOPS)}
+
+
+def syntax_error(msg: str, expr: str, pos: int) -> SyntaxError:
+    line = expr.count("\n", 0, pos)
+    start = expr.rfind("\n", 0, pos) + 1
+    end = expr.find("\n", pos)
+    return SyntaxError(f"{msg} at position {pos}", ("<expr>", line + 1, pos - start + 1,
+                                                    expr[start:end if end >= 0 else len(expr)]))
+
+
 def parse(expr: str) -> Term:
+    """Operator precedence parsing with explicit stacks, so that nesting depth isn't limited by recursion
+
+    ! binds tightest, then the binary operators in the order of BINOPS, all right-associative; a quantifier applies
+    to the whole expression that follows it."""
     tokens = tokenize(expr)
-    pos = 0
+    values: List[Term] = []
+    # pending operators and groups: (kind, position, data)
+    stack: List[Tuple[str, int, object]] = []
+    operand = True
 
     def die(tok: Token):
-        raise SyntaxError("Unexpected token: " + str(tok))
-
-    def peek() -> Optional[Token]:
-        if pos < len(tokens):
-            return tokens[pos]
-        return None
-
-    def expect(*vals: str) -> bool:
-        cur = peek()
-        if cur and cur.val in vals:
-            read()
-            return True
-        return False
-
-    def read() -> Token:
-        nonlocal pos
-        if pos >= len(expr):
-            raise SyntaxError("Unexpected EOL")
-        pos += 1
-        return tokens[pos - 1]
-
-    def read_term() -> Term:
-        tok = peek()
-        if tok.val == "!":
-            read()
-            return Not(read_term())
-        if tok.val in PARENS:
-            read()
-            res = read_expr()
-            assert expect(PARENS[tok.val]), "Unclosed parenthesis"
-            return res
-        if tok.type == Token.VAR:
-            name = read().val
-            if name in CONSTS:
-                return CONSTS[name]()
-            if expect("("):
-                args = [read_expr()]
-                while expect(","):
-                    args.append(read_expr())
-                assert expect(")"), "Unclosed parenthesis"
-                return NamedPredicate(name, tuple(args))
-            if name[0].islower():
-                return Constant(name)
-            else:
-                return Variable(name)
-        if tok.val in QUANTIFIERS:
-            read()
-            var = read()
-            assert var.type == Token.VAR and not var.val[0].islower(), "Expected variable after quantifier"
-            qexpr = read_expr()
-            return QUANTIFIERS[tok.val](Variable(var.val), qexpr)
-        die(tok)
-
-    def read_binop(operator: str, clazz: type, left_func: callable):
-        def reader() -> Term:
-            left = left_func()
-            while expect(operator):
-                ph = expect("*")
-                args = [(left, reader())]
+        raise syntax_error("Unexpected token: " + str(tok), expr, tok.pos)
+
+    def reduce(level: int = len(BINOPS)):
+        """Applies the pending operators binding tighter than level, stopping at the innermost group"""
+        while stack:
+            kind, _, data = stack[-1]
+            if kind == "not":
+                values.append(Not(values.pop()))
+            elif kind == "bin" and LEVELS[data[0]] < level:
+                op, ph = data
+                cls = BINOPS[op]
+                if issubclass(cls, VariadicOp):
+                    # a & b & c is a & (b & c), which flattens to the operands of the whole run with the placeholder
+                    # of the first operator: build it at once rather than once per operator
+                    count = 1
+                    while count < len(stack) and stack[-1 - count][0] == "bin" and stack[-1 - count][2][0] == op:
+                        count += 1
+                    ph = stack[-count][2][1]
+                    args = values[-count - 1:]
+                    del values[-count - 1:], stack[-count:]
+                    values.append(cls(args, "*" if ph else ""))
+                    continue
+                right = values.pop()
+                args = [(values.pop(), right)]
                 if ph:
                     args.append("*")
-                left = clazz(*args)
-            return left
+                values.append(cls(*args))
+            elif kind == "quant" and level == len(BINOPS):
+                values.append(QUANTIFIERS[data[0]](data[1], values.pop()))
+            else:
+                return
+            stack.pop()
+
+    i = 0
+    while i < len(tokens):
+        tok = tokens[i]
+        i += 1
+        if operand:
+            if tok.type == Token.VAR:
+                name = tok.val
+                if name in CONSTS:
+                    values.append(CONSTS[name]())
+                elif i < len(tokens) and tokens[i].val == "(" and tokens[i].type == Token.OP:
+                    i += 1
+                    stack.append(("call", tok.pos, [name, 1]))
+                    continue
+                else:
+                    values.append(get_atom(name))
+                operand = False
+            elif tok.val == NEGATION:
+                stack.append(("not", tok.pos, None))
+            elif tok.val in PARENS:
+                stack.append(("paren", tok.pos, PARENS[tok.val]))
+            elif tok.val in QUANTIFIERS:
+                if i >= len(tokens):
+                    raise syntax_error("Unexpected EOL", expr, len(expr))
+                var = tokens[i]
+                i += 1
+                if var.type != Token.VAR or var.val[0].islower():
+                    raise syntax_error("Expected variable after quantifier", expr, var.pos)
+                stack.append(("quant", tok.pos, (tok.val, Variable(var.val))))
+            else:
+                die(tok)
+        elif tok.type == Token.OP and tok.val in BINOPS:
+            reduce(LEVELS[tok.val])
+            ph = i < len(tokens) and tokens[i].val in WILDCARDS and tokens[i].type == Token.OP
+            if ph:
+                i += 1
+            stack.append(("bin", tok.pos, (tok.val, ph)))
+            operand = True
+        elif tok.type == Token.OP and tok.val in (COMMA, *PARENS.values()):
+            reduce()
+            if not stack or stack[-1][0] not in ("paren", "call"):
+                die(tok)
+            kind, _, data = stack[-1]
+            if kind == "call" and tok.val == COMMA:
+                data[1] += 1
+                operand = True
+                continue
+            if (kind == "call" and tok.val != ")") or (kind == "paren" and tok.val != data):
+                raise syntax_error("Unclosed parenthesis", expr, stack[-1][1])
+            stack.pop()
+            if kind == "call":
+                name, count = data
+                args = tuple(values[-count:])
+                del values[-count:]
+                values.append(NamedPredicate(name, args))
+        else:
+            die(tok)
 
-        return reader
+    if operand:
+        raise syntax_error("Unexpected EOL", expr, len(expr))
+    reduce()
+    if stack:
+        raise syntax_error("Unclosed parenthesis", expr, stack[-1][1])
+    return values[0]
 
-    binop_funcs = [read_term]
-    for op, cl in BINOPS.items():
-        binop_funcs.append(read_binop(op, cl, binop_funcs[-1]))
 
-    def read_expr() -> Term:
-        return binop_funcs[-1]()
+def parse_many(lines: Iterable[str], first: int = 1) -> Iterator[Term]:
+    """Parses each non-blank line, the line numbers of the errors starting from first"""
+    for number, line in enumerate(lines, first):
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        if line.isspace() or not line:
+            continue
+        try:
+            term = parse(line.rstrip("\r\n"))
+        except SyntaxError as e:
+            raise SyntaxError(e.msg, (e.filename, number, e.offset, e.text)) from None
+        yield term
 
-    res = read_expr()
 
-    assert peek() is None, die(peek())
+def parse_batch(lines: List[str], first: int) -> List[Term]:
+    return list(parse_many(lines, first))
 
-    return res
+
+def parse_stream(source: Union[IO, mmap.mmap], workers: Optional[int] = None, batch: int = 4096) -> Iterator[Term]:
+    """Lazily parses a file of formulas, one per line, from a text or binary file object or a memory map
+
+    With several workers, batches of lines are parsed by a process pool, at most two per worker at a time, and the
+    terms are still yielded in the order of the file."""
+    lines = iter(source.readline, b"") if isinstance(source, mmap.mmap) else iter(source)
+    if workers is None or workers < 2:
+        yield from parse_many(lines)
+        return
+
+    def batches():
+        first = 1
+        while chunk := [line.decode("utf-8") if isinstance(line, bytes) else line
+                        for line in itertools.islice(lines, batch)]:
+            yield chunk, first
+            first += len(chunk)
+
+    for terms in map_ordered(parse_batch, batches(), workers):
+        yield from terms
@@ -0,0 +1,193 @@
+# coding: utf-8
+import dataclasses
+import hashlib
+import json
+import os
+import sqlite3
+import weakref
+from typing import Dict, Optional
+
+import expression
+from expression import Term
+from rules import Ruleset, RULES_DNF
+from simplify import simplify
+
+# bump when the encoding or the simplifier changes in a way that makes stored results stale
+VERSION = 2
+
+
+def get_children(val) -> list:
+    """Subterms held by the value of a field"""
+    if isinstance(val, Term):
+        return [val]
+    if isinstance(val, (tuple, list)):
+        return list(val)
+    return []
+
+
+def get_node_digest(term: Term, memo: Dict[Term, str]) -> str:
+    """Digest of term computed from the digests of its children, so that equal terms get the same one whatever the
+    order of their arguments; memo keeps the digest of every subterm"""
+    stack = [(term, False)]
+    while stack:
+        t, ready = stack.pop()
+        if t in memo:
+            continue
+        if not ready:
+            stack.append((t, True))
+            stack.extend((c, False) for c in t.get_child_terms() if c not in memo)
+            continue
+        parts = [type(t).__name__]
+        for field in dataclasses.fields(t):
+            val = getattr(t, field.name)
+            if isinstance(val, Term):
+                parts.append(memo[val])
+            elif isinstance(val, tuple):
+                parts.append([memo[v] for v in val])
+            elif isinstance(val, frozenset):
+                parts.append(sorted(memo[v] for v in val))
+            else:
+                parts.append(val)
+        memo[t] = get_digest(json.dumps(parts))
+    return memo[term]
+
+
+def dumps(term: Term, memo: Optional[Dict[Term, str]] = None) -> str:
+    """Canonical JSON encoding of term: equal terms give the same text, whatever the order of their arguments
+
+    The nodes are listed children first, each shared subterm once, and refer to their children by index, so the text
+    stays flat however deep the term is."""
+    if memo is None:
+        memo = {}
+    get_node_digest(term, memo)
+
+    def get_fields(t: Term) -> list:
+        # frozensets in the order of the digests of their elements, which doesn't depend on the hash seed
+        return [sorted(val, key=memo.__getitem__) if isinstance(val, frozenset) else val
+                for val in (getattr(t, field.name) for field in dataclasses.fields(t))]
+
+    nodes = []
+    index: Dict[str, int] = {}
+    stack = [(term, False)]
+    while stack:
+        t, ready = stack.pop()
+        if memo[t] in index:
+            continue
+        fields = get_fields(t)
+        if not ready:
+            stack.append((t, True))
+            stack.extend((c, False) for val in reversed(fields) for c in reversed(get_children(val)))
+            continue
+        node = [type(t).__name__]
+        for val in fields:
+            if isinstance(val, Term):
+                node.append(index[memo[val]])
+            elif isinstance(val, (tuple, list)):
+                node.append([index[memo[v]] for v in val])
+            else:
+                node.append(val)
+        index[memo[t]] = len(nodes)
+        nodes.append(node)
+    return json.dumps(nodes)
+
+
+def decode(data: list) -> Term:
+    """Term of the node list produced by dumps, which is its last node"""
+    nodes = []
+    for node in data:
+        cls = getattr(expression, node[0], None)
+        if not (isinstance(cls, type) and issubclass(cls, Term)):
+            raise ValueError(f"Unknown term type: {node[0]}")
+        fields = []
+        for val in node[1:]:
+            if isinstance(val, int):
+                fields.append(nodes[val])
+            elif isinstance(val, list):
+                fields.append(tuple(nodes[i] for i in val))
+            else:
+                fields.append(val)
+        nodes.append(cls(*fields))
+    return nodes[-1]
+
+
+def loads(text: str) -> Term:
+    return decode(json.loads(text))
+
+
+def get_digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+fingerprints = weakref.WeakKeyDictionary()
+
+
+def get_fingerprint(rules: Ruleset) -> str:
+    """Stable across processes, unlike the hash of the ruleset"""
+    # kept with the hash of the ruleset it was computed for, which changes with the rules
+    current = hash(rules)
+    cached_hash, digest = fingerprints.get(rules, (None, None))
+    if cached_hash != current:
+        memo = {}
+        digest = get_digest(f"{VERSION}\n" + "\n".join(
+            get_node_digest(src, memo) + "\t" + get_node_digest(dest, memo) for src, dest in rules.items()))
+        fingerprints[rules] = current, digest
+    return digest
+
+
+class SimplifyStore:
+    """Results of simplify kept in an SQLite database, which can be shared by several processes
+
+    Entries are keyed by the fingerprint of the ruleset, so changing the rules never returns stale results;
+    prune removes the entries of the rulesets that aren't in use anymore."""
+
+    def __init__(self, path: str, timeout: float = 30):
+        self.path = path
+        self.timeout = timeout
+        self.__conn = None
+        self.__pid = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # connections can't be carried over a fork
+        if self.__conn is None or self.__pid != os.getpid():
+            self.__conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            self.__pid = os.getpid()
+            self.__conn.execute("PRAGMA journal_mode=WAL")
+            self.__conn.execute("PRAGMA synchronous=NORMAL")
+            self.__conn.execute("CREATE TABLE IF NOT EXISTS simplify ("
+                                "rules TEXT NOT NULL, term TEXT NOT NULL, result TEXT NOT NULL, "
+                                "PRIMARY KEY (rules, term)) WITHOUT ROWID")
+        return self.__conn
+
+    def get(self, term: Term, rules: Ruleset = RULES_DNF) -> Optional[Term]:
+        row = self.conn.execute("SELECT result FROM simplify WHERE rules = ? AND term = ?",
+                                (get_fingerprint(rules), get_digest(dumps(term)))).fetchone()
+        return row and loads(row[0])
+
+    def put(self, term: Term, result: Term, rules: Ruleset = RULES_DNF):
+        self.conn.execute("INSERT OR REPLACE INTO simplify (rules, term, result) VALUES (?, ?, ?)",
+                          (get_fingerprint(rules), get_digest(dumps(term)), dumps(result)))
+
+    def simplify(self, term: Term, rules: Ruleset = RULES_DNF) -> Term:
+        res = self.get(term, rules)
+        if res is None:
+            res = simplify(term, rules)
+            self.put(term, res, rules)
+        return res
+
+    def invalidate(self, rules: Optional[Ruleset] = None):
+        """Forgets the results for rules, or all of them"""
+        if rules is None:
+            self.conn.execute("DELETE FROM simplify")
+        else:
+            self.conn.execute("DELETE FROM simplify WHERE rules = ?", (get_fingerprint(rules),))
+
+    def prune(self, *rules: Ruleset):
+        """Forgets the results for every ruleset but the given ones"""
+        keep = [get_fingerprint(r) for r in rules]
+        self.conn.execute(f"DELETE FROM simplify WHERE rules NOT IN ({', '.join('?' * len(keep))})", keep)
+
+    def close(self):
+        if self.__conn is not None and self.__pid == os.getpid():
+            self.__conn.close()
+        self.__conn = None
@@ -1,47 +1,150 @@
 # coding: utf-8
-from collections import Set
-from typing import List
+import heapq
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
 import numpy as np
 
-from expression import Term
+from expression import Term, NamedValue, Variable, Constant, Not, And, Or, Positive, Negative
+from truth_table import TruthTable
+
+# bits set in the mask are free, the others must be equal to those of the value
+# the first variable is the most significant bit, like the rows of a truth table
+Implicant = Tuple[int, int]
+
+# number of partial covers Petrick's method may keep before falling back to the greedy cover
+PETRICK_LIMIT = 256
+
+
+def popcount(nb: int) -> int:
+    return bin(nb).count("1")
+
+
+def get_literal_count(imp: Implicant, bits: int) -> int:
+    return bits - popcount(imp[1])
 
 
-def find_neighbors(nb: int, bits: int) -> Set[int]:
-    return {nb ^ (1 << b) for b in range(bits)}
+def get_minterms(imp: Implicant) -> Iterable[int]:
+    value, mask = imp
+    free = [1 << b for b in range(mask.bit_length()) if mask >> b & 1]
+    for i in range(1 << len(free)):
+        yield value | sum(bit for j, bit in enumerate(free) if i >> j & 1)
 
 
-def group_by(items):
-    items = list(items)
-    res = set()
-    rem = set()
-    for i, term1 in enumerate(items):
-        for j, term2 in enumerate(items[i+1:]):
-            diff = [i for i, (a, b) in enumerate(zip(term1, term2)) if a != b]
-            if len(diff) != 1:
+def get_prime_implicants(bits: int, minterms: Iterable[int]) -> Set[Implicant]:
+    groups: Dict[int, Set[Implicant]] = {}
+    for m in minterms:
+        groups.setdefault(popcount(m), set()).add((m, 0))
+
+    primes = set()
+    while groups:
+        merged: Dict[int, Set[Implicant]] = {}
+        used = set()
+        for count, group in groups.items():
+            upper = groups.get(count + 1)
+            if not upper:
                 continue
-            n = diff[0]
-            rem.add(term1)
-            rem.add(term2)
-            res.add(term1[:n] + "-" + term1[n+1:])
-    return res, rem
-
-def to_nums(imp: str):
-    ids = [i for i, c in enumerate(imp) if c == "-"]
-    for i, j in enumerate(ids):
-        pass
-
-def execute(vars: int, *minterms: int) -> Term:
-
-    return
-
-
-    imps = [[f"{x:04b}" for x in minterms]]
-    while True:
-        res, rem = group_by(imps[-1])
-        if not res:
-            break
-        for x in rem:
-            imps[-1].remove(x)
-        imps.append(list(res))
-    print(imps)
-    return None
+            for value, mask in group:
+                for b in range(bits):
+                    bit = 1 << b
+                    if (value | mask) & bit:
+                        continue
+                    if (value | bit, mask) in upper:
+                        merged.setdefault(count, set()).add((value, mask | bit))
+                        used.add((value, mask))
+                        used.add((value | bit, mask))
+        for group in groups.values():
+            primes |= group - used
+        groups = merged
+    return primes
+
+
+def get_cover(bits: int, primes: Set[Implicant], minterms: Set[int]) -> List[Implicant]:
+    chart: Dict[int, Set[Implicant]] = {m: set() for m in minterms}
+    for imp in primes:
+        for m in get_minterms(imp):
+            if m in chart:
+                chart[m].add(imp)
+
+    cover = list({next(iter(chart[m])) for m in minterms if len(chart[m]) == 1})
+    remaining = set(minterms)
+    for imp in cover:
+        remaining.difference_update(get_minterms(imp))
+    if not remaining:
+        return cover
+
+    return cover + (petrick(bits, chart, remaining) or greedy(bits, chart, remaining))
+
+
+def petrick(bits: int, chart: Dict[int, Set[Implicant]], minterms: Set[int]) -> Optional[List[Implicant]]:
+    products = {frozenset()}
+    for m in sorted(minterms, key=lambda m: len(chart[m])):
+        nproducts = set()
+        for prod in products:
+            if prod & chart[m]:
+                nproducts.add(prod)
+            else:
+                nproducts.update(prod | {imp} for imp in chart[m])
+        # absorption: X + XY = X
+        products = set()
+        for prod in sorted(nproducts, key=len):
+            if not any(other <= prod for other in products):
+                products.add(prod)
+        if len(products) > PETRICK_LIMIT:
+            return None
+    return list(min(products, key=lambda prod: (len(prod), sum(get_literal_count(imp, bits) for imp in prod))))
+
+
+def greedy(bits: int, chart: Dict[int, Set[Implicant]], minterms: Set[int]) -> List[Implicant]:
+    covers: Dict[Implicant, Set[int]] = {}
+    for m in minterms:
+        for imp in chart[m]:
+            covers.setdefault(imp, set()).add(m)
+
+    # lazy max-heap on the number of still uncovered minterms, stale entries are pushed back with their new count
+    heap = [(-len(ms), get_literal_count(imp, bits), imp) for imp, ms in covers.items()]
+    heapq.heapify(heap)
+    cover = []
+    while heap:
+        count, lits, imp = heapq.heappop(heap)
+        if not covers[imp]:
+            continue
+        if -count != len(covers[imp]):
+            heapq.heappush(heap, (-len(covers[imp]), lits, imp))
+            continue
+        cover.append(imp)
+        for m in covers[imp].copy():
+            for other in chart[m]:
+                covers[other].discard(m)
+    return cover
+
+
+def named(name: str) -> NamedValue:
+    # same convention as the parser
+    return Constant(name) if name[0].islower() else Variable(name)
+
+
+def to_term(names: Sequence[NamedValue], implicants: Iterable[Implicant]) -> Term:
+    bits = len(names)
+    products = []
+    for value, mask in implicants:
+        lits = [var if value >> (bits - 1 - i) & 1 else Not(var)
+                for i, var in enumerate(names) if not mask >> (bits - 1 - i) & 1]
+        if not lits:
+            return Positive()
+        products.append(lits[0] if len(lits) == 1 else And(lits))
+    if not products:
+        return Negative()
+    return products[0] if len(products) == 1 else Or(products)
+
+
+def execute(vars: int, *minterms: int, dont_cares: Iterable[int] = (), names: Optional[Sequence[str]] = None) -> Term:
+    if names is None:
+        names = [chr(ord("A") + x) for x in range(vars)]
+    minterms = set(minterms)
+    primes = get_prime_implicants(vars, minterms | set(dont_cares))
+    return to_term(list(map(named, names)), get_cover(vars, primes, minterms))
+
+
+def from_truth_table(table: TruthTable, dont_cares: Iterable[int] = ()) -> Term:
+    minterms = np.flatnonzero(table.get_column())
+    return execute(len(table.variables), *map(int, minterms), dont_cares=dont_cares, names=table.variables)
@@ -1,16 +1,36 @@
 # coding: utf-8
+import heapq
 import operator
-from collections import OrderedDict, Mapping
+from collections import OrderedDict
+from collections.abc import Mapping
 from functools import reduce
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
 
-from expression import Imp, Equ, Not, Negative, Positive, Term, VariadicOp, Variable
+from expression import Imp, Equ, Not, Negative, Positive, Term, VariadicOp, Variable, NamedValue, NamedPredicate
 from parse import parse as _
 
 
+def get_head(term: Term) -> Hashable:
+    """Key shared by all the terms a rule pattern must have the same head as to unify with it"""
+    if isinstance(term, (NamedValue, NamedPredicate)):
+        return type(term), term.name
+    return type(term)
+
+
+def get_pattern_head(pattern: Term) -> Optional[Hashable]:
+    if isinstance(pattern, Variable) and pattern.name[0] == "$":
+        return None  # placeholders can be unified with anything
+    return get_head(pattern)
+
+
 class Ruleset(Mapping):
     def __init__(self, *args, **kwargs):
-        self.__dict = OrderedDict(*args, **kwargs)
+        self.__dict = OrderedDict()
         self.__hash = None
+        # left-hand sides by head, each list in insertion order
+        self.__index: Dict[Optional[Hashable], List[Tuple[int, Term]]] = {}
+        for a, b in OrderedDict(*args, **kwargs).items():
+            self.add_raw(a, b)
 
     def __getitem__(self, item):
         return self.__dict[item]
@@ -22,7 +42,9 @@ class Ruleset(Mapping):
         return len(self.__dict)
 
     def __hash__(self):
-        return reduce(operator.xor, map(hash, self.__dict.items()), 0)
+        if self.__hash is None:
+            self.__hash = reduce(operator.xor, map(hash, self.__dict.items()), 0)
+        return self.__hash
 
     def __repr__(self):
         return '{}({!r})'.format(self.__class__.__name__, self.__dict.items())
@@ -35,10 +57,21 @@ class Ruleset(Mapping):
 
         return self.__class__(new_dict)
 
-    def add_raw(self, a, b, bidi: bool = False):
+    def get_candidates(self, term: Term) -> Iterable[Tuple[Term, Term]]:
+        """Rules whose left-hand side may be unified with term, in insertion order"""
+        for pos, src in heapq.merge(self.__index.get(get_head(term), ()), self.__index.get(None, ())):
+            yield src, self.__dict[src]
+
+    def __set(self, a, b):
+        if a not in self.__dict:
+            self.__index.setdefault(get_pattern_head(a), []).append((len(self.__dict), a))
         self.__dict[a] = b
+        self.__hash = None
+
+    def add_raw(self, a, b, bidi: bool = False):
+        self.__set(a, b)
         if bidi:
-            self.__dict[b] = a
+            self.__set(b, a)
 
     def add(self, *rules: str) -> "Ruleset":
         res = self.copy()
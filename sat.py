@@ -0,0 +1,350 @@
+# coding: utf-8
+import heapq
+from typing import Dict, List, Optional, Tuple
+
+from expression import *
+
+# literals are non-zero ints as in DIMACS: v for variable v, -v for its negation
+
+
+class CNF:
+    """Tseitin encoding: each operator gets a fresh variable equivalent to it, so the clauses grow linearly"""
+
+    def __init__(self):
+        self.count = 0
+        self.variables: Dict[str, int] = {}
+        self.clauses: List[List[int]] = []
+        self.literals: Dict[Term, int] = {}
+        self.true = 0
+
+    def new_var(self) -> int:
+        self.count += 1
+        return self.count
+
+    def get_var(self, name: str) -> int:
+        if name not in self.variables:
+            self.variables[name] = self.new_var()
+        return self.variables[name]
+
+    def get_true(self) -> int:
+        if not self.true:
+            self.true = self.new_var()
+            self.clauses.append([self.true])
+        return self.true
+
+    def encode(self, term: Term) -> int:
+        """Literal equivalent to term"""
+        lits = self.literals
+        stack = [(term, False)]
+        while stack:
+            t, ready = stack.pop()
+            if t in lits:
+                continue
+            if isinstance(t, Literal):
+                lits[t] = self.get_true() if isinstance(t, Positive) else -self.get_true()
+                continue
+            if isinstance(t, NamedValue):
+                lits[t] = self.get_var(t.name)
+                continue
+            if not isinstance(t, (Not, VariadicOp, BinOp)):
+                raise NotImplementedError
+            args = t.get_args()
+            if not ready:
+                stack.append((t, True))
+                stack.extend((arg, False) for arg in args)
+                continue
+            if isinstance(t, Not):
+                lits[t] = -lits[t.elem]
+                continue
+            g = lits[t] = self.new_var()
+            if isinstance(t, VariadicOp):
+                # an or is the negation of the and of the negations
+                sign = 1 if isinstance(t, And) else -1
+                ins = [sign * lits[arg] for arg in args]
+                self.clauses.extend([-sign * g, a] for a in ins)
+                self.clauses.append([sign * g] + [-a for a in ins])
+            elif isinstance(t, Imp):
+                a, b = lits[args[0]], lits[args[1]]
+                self.clauses += [[-g, -a, b], [g, a], [g, -b]]
+            elif isinstance(t, Equ):
+                a, b = lits[args[0]], lits[args[1]]
+                self.clauses += [[-g, -a, b], [-g, a, -b], [g, a, b], [g, -a, -b]]
+        return lits[term]
+
+
+def luby(i: int) -> int:
+    """i-th term (from 1) of the Luby sequence 1, 1, 2, 1, 1, 2, 4, ..."""
+    while True:
+        k = i.bit_length()
+        if i == (1 << k) - 1:
+            return 1 << (k - 1)
+        i -= (1 << (k - 1)) - 1
+
+
+class Solver:
+    """Conflict-driven clause learning: two watched literals, first-UIP learning, VSIDS branching with phase saving,
+    Luby restarts and periodic removal of the longest learnt clauses"""
+
+    RESTART_BASE = 100
+    DECAY = 0.95
+
+    def __init__(self, count: int = 0):
+        self.count = 0
+        self.ok = True
+        self.clauses: List[Optional[List[int]]] = []
+        self.learnts: List[int] = []
+        self.max_learnts = 1000
+        # indexed by variable
+        self.values: List[int] = [0]
+        self.levels: List[int] = [0]
+        self.reasons: List[Optional[int]] = [None]
+        self.activity: List[float] = [0.0]
+        self.phase: List[bool] = [False]
+        # indexed by literal, negative ones from the end
+        self.watches: List[List[int]] = [[]]
+        self.trail: List[int] = []
+        self.trail_lim: List[int] = []
+        self.head = 0
+        self.inc = 1.0
+        self.heap: List[Tuple[float, int]] = []
+        self.conflicts = 0
+        for _ in range(count):
+            self.new_var()
+
+    def new_var(self) -> int:
+        self.count += 1
+        v = self.count
+        self.values.append(0)
+        self.levels.append(0)
+        self.reasons.append(None)
+        self.activity.append(0.0)
+        self.phase.append(False)
+        self.watches[v:v] = [[], []]
+        heapq.heappush(self.heap, (0.0, v))
+        return v
+
+    def value(self, lit: int) -> int:
+        """1 if lit is true, -1 if it is false, 0 if unassigned"""
+        val = self.values[abs(lit)]
+        return val if lit > 0 else -val
+
+    def get_level(self) -> int:
+        return len(self.trail_lim)
+
+    def enqueue(self, lit: int, reason: Optional[int]):
+        v = abs(lit)
+        self.values[v] = 1 if lit > 0 else -1
+        self.levels[v] = self.get_level()
+        self.reasons[v] = reason
+        self.trail.append(lit)
+
+    def attach(self, clause: List[int]) -> int:
+        i = len(self.clauses)
+        self.clauses.append(clause)
+        self.watches[clause[0]].append(i)
+        self.watches[clause[1]].append(i)
+        return i
+
+    def add_clause(self, lits: List[int]) -> bool:
+        """Adds a clause before solving, returns False if the formula became unsatisfiable"""
+        if not self.ok:
+            return False
+        for lit in lits:
+            while abs(lit) > self.count:
+                self.new_var()
+        clause = []
+        for lit in dict.fromkeys(lits):
+            if -lit in clause or self.value(lit) == 1:
+                return True
+            if self.value(lit) == 0:
+                clause.append(lit)
+        if not clause:
+            self.ok = False
+        elif len(clause) == 1:
+            self.enqueue(clause[0], None)
+            self.ok = self.propagate() is None
+        else:
+            self.attach(clause)
+        return self.ok
+
+    def propagate(self) -> Optional[int]:
+        """Assigns the literals implied by the trail, returns the index of a falsified clause if any"""
+        while self.head < len(self.trail):
+            false = -self.trail[self.head]
+            self.head += 1
+            watchers = self.watches[false]
+            i = j = 0
+            while i < len(watchers):
+                ci = watchers[i]
+                i += 1
+                c = self.clauses[ci]
+                if c is None:
+                    continue
+                if c[0] == false:
+                    c[0], c[1] = c[1], false
+                if self.value(c[0]) == 1:
+                    watchers[j] = ci
+                    j += 1
+                    continue
+                for k in range(2, len(c)):
+                    if self.value(c[k]) != -1:
+                        c[1], c[k] = c[k], false
+                        self.watches[c[1]].append(ci)
+                        break
+                else:
+                    watchers[j] = ci
+                    j += 1
+                    if self.value(c[0]) == -1:
+                        watchers[j:] = watchers[i:]
+                        return ci
+                    self.enqueue(c[0], ci)
+            del watchers[j:]
+        return None
+
+    def bump(self, v: int):
+        self.activity[v] += self.inc
+        if self.activity[v] > 1e100:
+            self.activity = [a * 1e-100 for a in self.activity]
+            self.inc *= 1e-100
+            self.heap = [(-self.activity[u], u) for u in range(1, self.count + 1) if not self.values[u]]
+            heapq.heapify(self.heap)
+        elif not self.values[v]:
+            heapq.heappush(self.heap, (-self.activity[v], v))
+
+    def analyze(self, conflict: int) -> Tuple[List[int], int]:
+        """First-UIP learnt clause for the conflict, and the level to backtrack to"""
+        seen = set()
+        learnt = [0]
+        pending = 0
+        level = self.get_level()
+        clause = self.clauses[conflict]
+        lit = 0
+        i = len(self.trail)
+        while True:
+            # the implied literal is always first in its reason
+            for q in clause if not lit else clause[1:]:
+                v = abs(q)
+                if v in seen or not self.levels[v]:
+                    continue
+                seen.add(v)
+                self.bump(v)
+                if self.levels[v] == level:
+                    pending += 1
+                else:
+                    learnt.append(q)
+            i -= 1
+            while abs(self.trail[i]) not in seen:
+                i -= 1
+            lit = self.trail[i]
+            pending -= 1
+            if not pending:
+                break
+            clause = self.clauses[self.reasons[abs(lit)]]
+        learnt[0] = -lit
+
+        if len(learnt) == 1:
+            return learnt, 0
+        k = max(range(1, len(learnt)), key=lambda k: self.levels[abs(learnt[k])])
+        learnt[1], learnt[k] = learnt[k], learnt[1]
+        return learnt, self.levels[abs(learnt[1])]
+
+    def backtrack(self, level: int):
+        if self.get_level() <= level:
+            return
+        start = self.trail_lim[level]
+        for lit in self.trail[start:]:
+            v = abs(lit)
+            self.phase[v] = lit > 0
+            self.values[v] = 0
+            self.reasons[v] = None
+            heapq.heappush(self.heap, (-self.activity[v], v))
+        del self.trail[start:]
+        del self.trail_lim[level:]
+        self.head = start
+
+    def pick(self) -> int:
+        """Unassigned variable of highest activity, or 0"""
+        while self.heap:
+            act, v = heapq.heappop(self.heap)
+            if not self.values[v] and -act == self.activity[v]:
+                return v
+        return next((v for v in range(1, self.count + 1) if not self.values[v]), 0)
+
+    def is_locked(self, ci: int) -> bool:
+        c = self.clauses[ci]
+        return self.reasons[abs(c[0])] == ci and self.value(c[0]) == 1
+
+    def reduce(self):
+        """Forgets the longer half of the learnt clauses that aren't the reason of an assignment"""
+        self.learnts.sort(key=lambda ci: len(self.clauses[ci]))
+        half = len(self.learnts) // 2
+        keep = self.learnts[:half]
+        for ci in self.learnts[half:]:
+            if self.is_locked(ci):
+                keep.append(ci)
+            else:
+                self.clauses[ci] = None
+        self.learnts = keep
+
+    def solve(self) -> bool:
+        if not self.ok or self.propagate() is not None:
+            self.ok = False
+            return False
+        restarts = 1
+        limit = self.conflicts + luby(restarts) * self.RESTART_BASE
+        while True:
+            conflict = self.propagate()
+            if conflict is not None:
+                self.conflicts += 1
+                if not self.get_level():
+                    self.ok = False
+                    return False
+                learnt, level = self.analyze(conflict)
+                self.backtrack(level)
+                if len(learnt) == 1:
+                    self.enqueue(learnt[0], None)
+                else:
+                    ci = self.attach(learnt)
+                    self.learnts.append(ci)
+                    self.enqueue(learnt[0], ci)
+                self.inc /= self.DECAY
+                continue
+
+            if self.conflicts >= limit:
+                restarts += 1
+                limit = self.conflicts + luby(restarts) * self.RESTART_BASE
+                self.backtrack(0)
+            if len(self.learnts) - len(self.trail) >= self.max_learnts:
+                self.reduce()
+                self.max_learnts = int(self.max_learnts * 1.1)
+            v = self.pick()
+            if not v:
+                return True
+            self.trail_lim.append(len(self.trail))
+            self.enqueue(v if self.phase[v] else -v, None)
+
+
+def solve(term: Term, negate: bool = False) -> Tuple[CNF, Solver, bool]:
+    cnf = CNF()
+    root = cnf.encode(term)
+    solver = Solver(cnf.count)
+    for clause in cnf.clauses:
+        solver.add_clause(clause)
+    solver.add_clause([-root if negate else root])
+    return cnf, solver, solver.solve()
+
+
+def get_model(term: Term) -> Optional[Interpretation]:
+    """Assignment of the variables of term that makes it true, if there is one"""
+    cnf, solver, res = solve(term)
+    if not res:
+        return None
+    return Interpretation({name: solver.values[v] == 1 for name, v in cnf.variables.items()})
+
+
+def is_sat(term: Term) -> bool:
+    return solve(term)[2]
+
+
+def is_tautology(term: Term) -> bool:
+    return not solve(term, negate=True)[2]
@@ -0,0 +1,241 @@
+# coding: utf-8
+import io
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Union
+
+from expression import *
+
+# a stream is the header followed by records, each starting with its tag as a varint
+# strings and nodes are numbered in the order they are defined; nodes refer to their children by the distance back
+# from their own number, which keeps the varints short
+MAGIC = b"LGTD"
+FORMAT_VERSION = 1
+
+STRING = 0
+POSITIVE = 1
+NEGATIVE = 2
+VARIABLE = 3
+CONSTANT = 4
+PREDICATE = 5
+AND = 6
+OR = 7
+IMP = 8
+EQU = 9
+NOT = 10
+UNIVERSAL = 11
+EXISTENTIAL = 12
+# yields the node that was just defined, or a given one
+ROOT = 13
+# forgets every string and node, to bound the memory of long streams
+RESET = 14
+
+TAGS = {
+    Positive: POSITIVE,
+    Negative: NEGATIVE,
+    Variable: VARIABLE,
+    Constant: CONSTANT,
+    NamedPredicate: PREDICATE,
+    And: AND,
+    Or: OR,
+    Imp: IMP,
+    Equ: EQU,
+    Not: NOT,
+    Universal: UNIVERSAL,
+    Existential: EXISTENTIAL
+}
+
+CHUNK = 1 << 16
+
+
+def write_varint(out: bytearray, n: int):
+    while n >= 0x80:
+        out.append(n & 0x7F | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def get_children(term: Term) -> Iterable[Term]:
+    if isinstance(term, Quantifier):
+        return term.var, term.expr
+    if isinstance(term, Not):
+        return term.elem,
+    if isinstance(term, Predicate):
+        return term.args
+    return ()
+
+
+class Writer:
+    """Writes terms to a binary file, each subterm and string only once for the whole stream"""
+
+    def __init__(self, file: BinaryIO):
+        self.file = file
+        self.nodes: Dict[Term, int] = {}
+        self.strings: Dict[str, int] = {}
+        file.write(MAGIC + bytes([FORMAT_VERSION]))
+
+    def add_string(self, out: bytearray, s: str) -> int:
+        if s not in self.strings:
+            data = s.encode("utf-8")
+            write_varint(out, STRING)
+            write_varint(out, len(data))
+            out += data
+            self.strings[s] = len(self.strings)
+        return self.strings[s]
+
+    def add_node(self, out: bytearray, term: Term):
+        tag = TAGS.get(type(term))
+        if tag is None:
+            raise NotImplementedError(f"Can't serialize {type(term).__name__}")
+        i = len(self.nodes)
+        # strings first, so that the node record itself is contiguous
+        if isinstance(term, (NamedValue, NamedPredicate)):
+            sid = self.add_string(out, term.name)
+        elif isinstance(term, VariadicOp):
+            sid = self.add_string(out, term.placeholder)
+        write_varint(out, tag)
+        if isinstance(term, (NamedValue, NamedPredicate, VariadicOp)):
+            write_varint(out, sid)
+        children = get_children(term)
+        if isinstance(term, (NamedPredicate, VariadicOp)):
+            write_varint(out, len(children))
+        for child in children:
+            write_varint(out, i - self.nodes[child])
+        self.nodes[term] = i
+
+    def write(self, term: Term):
+        out = bytearray()
+        stack = [(term, False)]
+        while stack:
+            t, ready = stack.pop()
+            if t in self.nodes:
+                continue
+            if ready:
+                self.add_node(out, t)
+                continue
+            stack.append((t, True))
+            stack.extend((c, False) for c in get_children(t) if c not in self.nodes)
+        write_varint(out, ROOT)
+        write_varint(out, len(self.nodes) - self.nodes[term])
+        self.file.write(out)
+
+    def reset(self):
+        out = bytearray()
+        write_varint(out, RESET)
+        self.file.write(out)
+        self.nodes.clear()
+        self.strings.clear()
+
+
+class Reader:
+    """Reads the terms of a stream lazily, from a bytes-like object without copying it, or from a binary file"""
+
+    def __init__(self, source: Union[bytes, bytearray, memoryview, BinaryIO]):
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            self.data = memoryview(source).cast("B")
+            self.file = None
+        else:
+            self.data = memoryview(b"")
+            self.file = source
+        self.pos = 0
+        self.nodes: List[Term] = []
+        self.strings: List[str] = []
+        if self.read(len(MAGIC)) != MAGIC:
+            raise ValueError("Not a term stream")
+        version = self.read(1)[0]
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported term stream version {version}")
+
+    def fill(self, n: int) -> bool:
+        """Makes sure n bytes can be read, returns False at the end of the stream"""
+        if self.pos + n <= len(self.data):
+            return True
+        if self.file is None:
+            return False
+        rest = bytes(self.data[self.pos:])
+        self.data = memoryview(rest + self.file.read(max(n, CHUNK)))
+        self.pos = 0
+        return n <= len(self.data)
+
+    def read(self, n: int) -> memoryview:
+        if not self.fill(n):
+            raise EOFError("Truncated term stream")
+        res = self.data[self.pos:self.pos + n]
+        self.pos += n
+        return res
+
+    def read_varint(self) -> int:
+        res = shift = 0
+        while True:
+            if self.pos >= len(self.data) and not self.fill(1):
+                raise EOFError("Truncated term stream")
+            byte = self.data[self.pos]
+            self.pos += 1
+            res |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return res
+            shift += 7
+
+    def read_child(self) -> Term:
+        return self.nodes[len(self.nodes) - self.read_varint()]
+
+    def read_term(self) -> Optional[Term]:
+        """Next term of the stream, or None at its end"""
+        nodes, strings = self.nodes, self.strings
+        while self.fill(1):
+            tag = self.read_varint()
+            if tag == STRING:
+                strings.append(str(self.read(self.read_varint()), "utf-8"))
+            elif tag == ROOT:
+                return nodes[len(nodes) - self.read_varint()]
+            elif tag == RESET:
+                nodes.clear()
+                strings.clear()
+            elif tag == POSITIVE:
+                nodes.append(Positive())
+            elif tag == NEGATIVE:
+                nodes.append(Negative())
+            elif tag == VARIABLE:
+                nodes.append(Variable(strings[self.read_varint()]))
+            elif tag == CONSTANT:
+                nodes.append(Constant(strings[self.read_varint()]))
+            elif tag == PREDICATE:
+                name = strings[self.read_varint()]
+                nodes.append(NamedPredicate(name, tuple(self.read_child() for _ in range(self.read_varint()))))
+            elif tag in (AND, OR):
+                placeholder = strings[self.read_varint()]
+                args = [self.read_child() for _ in range(self.read_varint())]
+                nodes.append((And if tag == AND else Or)(args, placeholder))
+            elif tag in (IMP, EQU):
+                left = self.read_child()
+                nodes.append((Imp if tag == IMP else Equ)((left, self.read_child())))
+            elif tag == NOT:
+                nodes.append(Not(self.read_child()))
+            elif tag in (UNIVERSAL, EXISTENTIAL):
+                var = self.read_child()
+                nodes.append((Universal if tag == UNIVERSAL else Existential)(var, self.read_child()))
+            else:
+                raise ValueError(f"Unknown record tag {tag}")
+        return None
+
+    def __iter__(self) -> Iterator[Term]:
+        while (term := self.read_term()) is not None:
+            yield term
+
+
+def dump(terms: Iterable[Term], file: BinaryIO):
+    writer = Writer(file)
+    for term in terms:
+        writer.write(term)
+
+
+def dumps(*terms: Term) -> bytes:
+    out = io.BytesIO()
+    dump(terms, out)
+    return out.getvalue()
+
+
+def load(source: Union[bytes, bytearray, memoryview, BinaryIO]) -> Iterator[Term]:
+    return iter(Reader(source))
+
+
+def loads(data: Union[bytes, bytearray, memoryview]) -> List[Term]:
+    return list(Reader(data))
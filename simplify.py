@@ -1,13 +1,15 @@
 # coding: utf-8
 import itertools
-from functools import lru_cache
+from typing import Callable, Iterator, Optional
 
+import tracing
+from cache import cached, LRUCache, MISSING
 from expression import *
 from rules import Ruleset, RULES_DNF
-from unify import find_unifications
+from unify import iter_unifications
 
 
-@lru_cache(maxsize=32)
+@cached("simplify_basic", namespace="rules")
 def simplify_basic(term: Term, rules: Ruleset = RULES_DNF) -> Term:
     if term.is_atomic():
         return term
@@ -21,31 +23,100 @@ def simplify_basic(term: Term, rules: Ruleset = RULES_DNF) -> Term:
     return term
 
 
-@lru_cache(maxsize=32)
+@cached("simplify_deep", namespace="rules")
 def simplify_deep(term: Term, rules: Ruleset = RULES_DNF) -> Term:
     term = simplify_basic(term, rules)
 
     return term.map_fields(lambda t: simplify(t, rules))
 
 
-@lru_cache(maxsize=32)
-def simplify(term: Term, rules: Ruleset = RULES_DNF) -> Term:
+def get_rewrites(term: Term, rules: Ruleset = RULES_DNF) -> Iterator[Term]:
+    seen = set()
+    for src, dest in rules.get_candidates(term):
+        unifications = iter_unifications(term, src)
+        if tracing.tracer is not None:
+            unifications = tracing.tracer.trace_rule(unifications, src, dest)
+        for unif in unifications:
+            res = dest.apply_subs(unif)
+            if res not in seen:
+                seen.add(res)
+                yield res
+
+
+def get_size(term: Term) -> int:
+    return term.get_size()
+
+
+def pick_rewrite(term: Term, rules: Ruleset = RULES_DNF, eager: bool = False,
+                 normalize: Callable[[Term], Term] = simplify_deep) -> Optional[Term]:
+    """Smallest simplified rewrite of term, or with eager, the first one that is smaller than term"""
+    size = get_size(term)
+    best, best_size = None, None
+    candidates = 0
+    for item in itertools.chain([term], get_rewrites(term, rules)):
+        candidates += 1
+        item = normalize(item)
+        if item == term:
+            continue
+        item_size = get_size(item)
+        if best is None or item_size < best_size:
+            best, best_size = item, item_size
+            if best_size == 1 or eager and best_size < size:
+                break  # can't do any better
+    if tracing.tracer is not None:
+        tracing.tracer.round(term, candidates, best)
+    return best
+
+
+@cached("simplify", namespace="rules")
+def simplify(term: Term, rules: Ruleset = RULES_DNF, eager: bool = False) -> Term:
+    source = term
     term = simplify_deep(term, rules)
     history = [term]
-    while True:
-        rules_simp = set(dest.apply_subs(unif) for src, dest in rules.items() for unif in find_unifications(term, src))
-        potential = list(sorted(filter(lambda r: r and r != term, (simplify_deep(item) for item in itertools.chain(
-            [term],
-            rules_simp))), key=lambda r: len(list(r.get_children()))))
-        for choice in potential:
-            if choice in history:
-                return term
-            term = choice
-            history.append(choice)
-            break
-        else:
+    while (choice := pick_rewrite(term, rules, eager)) is not None:
+        if choice in history:
             break
+        term = choice
+        history.append(choice)
+    else:
+        term = simplify_deep(term) or term
 
-    return simplify_deep(term) or term
+    if tracing.tracer is not None:
+        tracing.tracer.simplified(source, term, len(history))
+    return term
+
+
+class IncrementalSimplifier:
+    """Simplifies bottom-up, remembering the simplified form of every subterm it went through
+
+    Terms are interned, so after an edit the new formula shares all its untouched subtrees with the old one: only the
+    nodes on the paths to the edits are new, and they are the only ones the rules are run on again."""
+
+    def __init__(self, rules: Ruleset = RULES_DNF, eager: bool = False, maxsize: Optional[int] = None):
+        self.rules = rules
+        self.eager = eager
+        self.forms = LRUCache(maxsize)
+
+    def normalize(self, term: Term) -> Term:
+        return simplify_basic(term, self.rules).map_fields(self.simplify)
+
+    def simplify(self, term: Term) -> Term:
+        res = self.forms.get(term)
+        if res is not MISSING:
+            return res
+
+        res = self.normalize(term)
+        history = [res]
+        while (choice := pick_rewrite(res, self.rules, self.eager, self.normalize)) is not None:
+            if choice in history:
+                break
+            res = choice
+            history.append(choice)
+        res = self.normalize(res)
 
+        self.forms.put(term, res)
+        return res
 
+    def replace(self, term: Term, find: Term, replace: Term) -> Term:
+        """Simplified form of term after replacing find with replace in it"""
+        return self.simplify(term.apply_sub(find, replace))
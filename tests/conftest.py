@@ -0,0 +1,39 @@
+# coding: utf-8
+import itertools
+import os
+import random
+import sys
+from typing import List, Sequence
+
+import pytest
+
+# the modules live at the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expression import *
+
+NAMES = ["A", "B", "C", "D", "E"]
+
+
+def random_formula(rng: random.Random, depth: int) -> Term:
+    if depth == 0 or rng.random() < 0.2:
+        return rng.choice([Variable(name) for name in NAMES] + [Positive(), Negative()])
+    kind = rng.choice([And, Or, Not, Imp, Equ])
+    if kind is Not:
+        return Not(random_formula(rng, depth - 1))
+    if kind in (Imp, Equ):
+        return kind((random_formula(rng, depth - 1), random_formula(rng, depth - 1)))
+    return kind([random_formula(rng, depth - 1) for _ in range(rng.randint(2, 3))])
+
+
+def evaluate_rows(term: Term, names: Sequence[str] = NAMES) -> List[bool]:
+    """Value of term on each assignment of names, the first name being the most significant bit of the row"""
+    return [term.evaluate(Interpretation(dict(zip(names, row))))
+            for row in itertools.product((False, True), repeat=len(names))]
+
+
+@pytest.fixture(scope="session")
+def formulas() -> List[Term]:
+    """Small random propositional formulas over NAMES, the same on every run"""
+    rng = random.Random(0)
+    return [random_formula(rng, 4) for _ in range(80)]
@@ -0,0 +1,44 @@
+# coding: utf-8
+import itertools
+
+from bdd import BDD, FALSE, TRUE, are_equivalent, count_models, from_terms
+from conftest import NAMES, evaluate_rows
+
+
+def evaluate_node(bdd: BDD, u: int, values: dict) -> bool:
+    while u not in (FALSE, TRUE):
+        lvl, low, high = bdd.nodes[u]
+        u = high if values[bdd.variables[lvl]] else low
+    return u == TRUE
+
+
+def node_rows(bdd: BDD, u: int):
+    return [evaluate_node(bdd, u, dict(zip(NAMES, row))) for row in itertools.product((False, True), repeat=len(NAMES))]
+
+
+def test_from_term_matches_truth_table(formulas):
+    bdd = BDD(NAMES)
+    for term in formulas:
+        assert node_rows(bdd, bdd.from_term(term)) == evaluate_rows(term), term
+
+
+def test_count_matches_truth_table(formulas):
+    bdd = BDD(NAMES)
+    for term in formulas:
+        assert bdd.count(bdd.from_term(term)) == sum(evaluate_rows(term)), term
+        names = sorted({v.name for v in term.get_vars()})
+        assert count_models(term) == sum(evaluate_rows(term, names)), term
+
+
+def test_are_equivalent_matches_truth_table(formulas):
+    for a, b in zip(formulas, formulas[1:]):
+        assert are_equivalent(a, b) == (evaluate_rows(a) == evaluate_rows(b)), (a, b)
+
+
+def test_sift_preserves_functions(formulas):
+    bdd, roots = from_terms(*formulas[:20])
+    sifted, nroots = bdd.sift(roots)
+    assert sifted.get_size(*nroots) <= bdd.get_size(*roots)
+    for term, u, v in zip(formulas, roots, nroots):
+        assert sifted.count(v) == bdd.count(u), term
+        assert node_rows(sifted, v) == evaluate_rows(term), term
@@ -0,0 +1,31 @@
+# coding: utf-8
+import espresso
+import qmc
+from conftest import NAMES, evaluate_rows
+from truth_table import TruthTable
+
+
+def test_qmc_equivalent_to_source(formulas):
+    for term in formulas:
+        table = TruthTable.from_term(term)
+        assert evaluate_rows(qmc.from_truth_table(table)) == evaluate_rows(term), term
+
+
+def test_qmc_dont_cares_only_free_their_rows():
+    minterms, dont_cares = {1, 3, 7, 11, 15}, {0, 2, 5}
+    rows = evaluate_rows(qmc.execute(4, *minterms, dont_cares=dont_cares), NAMES[:4])
+    assert {i for i, val in enumerate(rows) if val} - dont_cares == minterms
+
+
+def test_espresso_equivalent_to_source(formulas):
+    for term in formulas:
+        assert evaluate_rows(espresso.execute(term)) == evaluate_rows(term), term
+        table = TruthTable.from_term(term)
+        assert evaluate_rows(espresso.execute(table)) == evaluate_rows(term), term
+
+
+def test_espresso_agrees_with_qmc(formulas):
+    for term in formulas:
+        table = TruthTable.from_term(term)
+        exact, heuristic = qmc.from_truth_table(table), espresso.execute(table)
+        assert evaluate_rows(heuristic) == evaluate_rows(exact), term
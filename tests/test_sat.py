@@ -0,0 +1,26 @@
+# coding: utf-8
+from conftest import NAMES, evaluate_rows
+from expression import Interpretation
+from sat import get_model, is_sat, is_tautology
+
+
+def test_is_sat_matches_truth_table(formulas):
+    for term in formulas:
+        assert is_sat(term) == any(evaluate_rows(term)), term
+
+
+def test_is_tautology_matches_truth_table(formulas):
+    for term in formulas:
+        assert is_tautology(term) == all(evaluate_rows(term)), term
+
+
+def test_get_model_satisfies_term(formulas):
+    for term in formulas:
+        model = get_model(term)
+        if not any(evaluate_rows(term)):
+            assert model is None, term
+            continue
+        # variables the encoding didn't need can take any value
+        values = dict.fromkeys(NAMES, False)
+        values.update(model.values)
+        assert term.evaluate(Interpretation(values)), term
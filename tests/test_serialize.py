@@ -0,0 +1,25 @@
+# coding: utf-8
+import io
+
+from parse import parse
+from serialize import Writer, dumps, load, loads
+
+FIRST_ORDER = ["∀X P(X, a) & !Q(b)", "∃Y (R(Y) => ∀X (P(X, Y) | TRUE))", "!(f(a) <=> FALSE)"]
+
+
+def test_round_trip_is_identity(formulas):
+    terms = formulas + [parse(src) for src in FIRST_ORDER]
+    res = loads(dumps(*terms))
+    assert len(res) == len(terms)
+    # terms are interned, so a faithful copy is the same object
+    assert all(a is b for a, b in zip(res, terms))
+
+
+def test_round_trip_through_reset(formulas):
+    out = io.BytesIO()
+    writer = Writer(out)
+    for i, term in enumerate(formulas):
+        if i % 7 == 0:
+            writer.reset()
+        writer.write(term)
+    assert list(load(out.getvalue())) == formulas
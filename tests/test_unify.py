@@ -0,0 +1,40 @@
+# coding: utf-8
+import os
+import subprocess
+import sys
+
+from parse import parse
+from unify import find_unifications
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# prints the unifications in a form that doesn't depend on the order they were found in
+SCRIPT = """
+from parse import parse
+from unify import find_unifications
+cases = [("A & B", "$X & B"), ("A | B | C", "$X | $Y | C"), ("f(A, B) & g(B)", "g($X) & f($Y, $X)")]
+for haystack, needle in cases:
+    unifs = find_unifications(parse(haystack), parse(needle), True)
+    print(sorted(sorted((str(k), str(v)) for k, v in unif.items()) for unif in unifs))
+"""
+
+
+def run_with_seed(seed: int) -> str:
+    env = dict(os.environ, PYTHONHASHSEED=str(seed))
+    return subprocess.run([sys.executable, "-c", SCRIPT], cwd=ROOT, env=env, capture_output=True, text=True,
+                          check=True).stdout
+
+
+def test_bidi_commutative_independent_of_hash_seed():
+    assert run_with_seed(0) == run_with_seed(3)
+
+
+def test_bidi_commutative_keeps_both_pairings():
+    out = run_with_seed(0).splitlines()[0]
+    assert "('$X', 'A')" in out and "('$X', 'B')" in out
+
+
+def test_bidi_unifies_every_pair():
+    assert find_unifications(parse("p(a, b, c)"), parse("p(a, d, c)"), True) == []
+    unifs = find_unifications(parse("p(X, Y, Z)"), parse("p(a, b, c)"), True)
+    assert [{str(k): str(v) for k, v in unif.items()} for unif in unifs] == [{"X": "a", "Y": "b", "Z": "c"}]
@@ -0,0 +1,166 @@
+# coding: utf-8
+import dataclasses
+import json
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, TextIO, Tuple
+
+# tracer receiving the measurements, None when tracing is off: the hooks only check this before doing anything else
+tracer: Optional["Tracer"] = None
+
+Event = Dict[str, Any]
+
+
+@dataclasses.dataclass
+class RuleStats:
+    attempts: int = 0
+    successes: int = 0
+    unifications: int = 0
+    time: float = 0.0
+
+
+class Tracer:
+    """Collects what the rewrite engine does: an event stream, and counters aggregated over it
+
+    Events are kept in memory unless keep_events is False, and are also passed to sink as they happen."""
+
+    def __init__(self, keep_events: bool = True, sink: Optional[Callable[[Event], None]] = None):
+        self.events: Optional[List[Event]] = [] if keep_events else None
+        self.sink = sink
+        self.start = time.perf_counter()
+        self.rules: Dict[str, RuleStats] = {}
+        self.rule_names: Dict[Tuple[Any, Any], str] = {}
+        self.unify_calls = 0
+        self.unify_time = 0.0
+        self.unify_depth = 0
+        self.caches: Dict[str, List[int]] = {}
+        self.simplify_calls = 0
+        self.rounds = 0
+        self.candidates = 0
+        self.max_candidates = 0
+
+    def emit(self, kind: str, **data):
+        if self.events is None and self.sink is None:
+            return
+        event = {"event": kind, "time": time.perf_counter() - self.start, **data}
+        if self.events is not None:
+            self.events.append(event)
+        if self.sink is not None:
+            self.sink(event)
+
+    def get_rule_name(self, src, dest) -> str:
+        key = src, dest
+        if key not in self.rule_names:
+            self.rule_names[key] = f"{src} → {dest}"
+        return self.rule_names[key]
+
+    def trace_rule(self, unifications: Iterator, src, dest) -> Iterator:
+        """Passes the unifications of a rule through, counting them and the time taken to produce them"""
+        name = self.get_rule_name(src, dest)
+        stats = self.rules.setdefault(name, RuleStats())
+        stats.attempts += 1
+        count = 0
+        elapsed = 0.0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    unif = next(unifications)
+                except StopIteration:
+                    break
+                finally:
+                    elapsed += time.perf_counter() - start
+                count += 1
+                yield unif
+        finally:
+            # also reached when the consumer stops early
+            stats.unifications += count
+            stats.successes += count > 0
+            stats.time += elapsed
+            self.emit("rule", rule=name, unifications=count, duration=elapsed)
+
+    def trace_unify(self, unifications: Iterator, haystack, needle) -> Iterator:
+        """Same for unify_functions; the time of the nested calls is only counted in the outermost one"""
+        outer = not self.unify_depth
+        count = 0
+        elapsed = 0.0
+        try:
+            while True:
+                self.unify_depth += 1
+                start = time.perf_counter()
+                try:
+                    unif = next(unifications)
+                except StopIteration:
+                    break
+                finally:
+                    elapsed += time.perf_counter() - start
+                    self.unify_depth -= 1
+                count += 1
+                yield unif
+        finally:
+            # also reached when the consumer stops early
+            self.unify_calls += 1
+            if outer:
+                self.unify_time += elapsed
+                self.emit("unify", haystack=str(haystack), needle=str(needle), unifications=count, duration=elapsed)
+
+    def cache_access(self, name: str, hit: bool):
+        counts = self.caches.setdefault(name, [0, 0])
+        counts[not hit] += 1
+
+    def round(self, term, candidates: int, choice):
+        """One round of picking a rewrite, having looked at the given number of candidates"""
+        self.rounds += 1
+        self.candidates += candidates
+        self.max_candidates = max(self.max_candidates, candidates)
+        self.emit("round", term=str(term), candidates=candidates, choice=None if choice is None else str(choice))
+
+    def simplified(self, term, result, iterations: int):
+        self.simplify_calls += 1
+        self.emit("simplify", term=str(term), result=str(result), iterations=iterations)
+
+    def get_report(self) -> Dict[str, Any]:
+        rules = sorted(self.rules.items(), key=lambda item: item[1].time, reverse=True)
+        return {
+            "duration": time.perf_counter() - self.start,
+            "rules": {name: dataclasses.asdict(stats) for name, stats in rules},
+            "unify": {"calls": self.unify_calls, "time": self.unify_time},
+            "caches": {name: {"hits": hits, "misses": misses} for name, (hits, misses) in self.caches.items()},
+            "simplify": {
+                "calls": self.simplify_calls,
+                "rounds": self.rounds,
+                "candidates": self.candidates,
+                "max_candidates": self.max_candidates
+            }
+        }
+
+    def format_report(self, top: int = 20) -> str:
+        report = self.get_report()
+        lines = [f"{'rule':<60}{'attempts':>10}{'matches':>10}{'unifs':>10}{'time (ms)':>12}"]
+        for name, stats in list(report["rules"].items())[:top]:
+            lines.append(f"{name[:59]:<60}{stats['attempts']:>10}{stats['successes']:>10}"
+                         f"{stats['unifications']:>10}{stats['time'] * 1e3:>12.2f}")
+        lines.append(f"unify_functions: {report['unify']['calls']} calls, {report['unify']['time'] * 1e3:.2f} ms")
+        for name, counts in report["caches"].items():
+            lines.append(f"cache {name}: {counts['hits']} hits, {counts['misses']} misses")
+        simp = report["simplify"]
+        lines.append(f"simplify: {simp['calls']} calls, {simp['rounds']} rounds, "
+                     f"{simp['candidates']} candidates (at most {simp['max_candidates']} in a round)")
+        return "\n".join(lines)
+
+    def write_events(self, file: TextIO):
+        """Writes the kept events as JSON lines"""
+        for event in self.events or ():
+            file.write(json.dumps(event, ensure_ascii=False) + "\n")
+
+
+@contextmanager
+def trace(keep_events: bool = True, sink: Optional[Callable[[Event], None]] = None) -> Iterator[Tracer]:
+    """Traces the rewrite engine inside the with block"""
+    global tracer
+    previous = tracer
+    tracer = Tracer(keep_events, sink)
+    try:
+        yield tracer
+    finally:
+        tracer = previous
@@ -1,38 +1,324 @@
 # coding: utf-8
 import dataclasses
+import io
 import itertools
-from typing import Dict, Tuple, Optional, Sequence
+import operator
+import struct
+from functools import reduce
+from typing import Dict, Tuple, Optional, Sequence, Iterator, Union, TextIO, Iterable, BinaryIO
 
-from expression import Term, Interpretation, Variable, Literal
-from process import simplify
+import numpy as np
+
+from expression import Term, Interpretation, Variable, Literal, Positive, Negative, NamedValue, Not, And, Or, Imp, Equ
+from simplify import simplify
+from parallel import map_ordered
+
+Bits = Union[np.ndarray, np.uint64]
+
+# rows are evaluated 64 at a time, one row per bit of a little-endian word
+WORD = np.dtype("<u8")
+ZEROS = np.uint64(0)
+ONES = np.uint64(0xFFFF_FFFF_FFFF_FFFF)
+# value of the k-th bit of the row index for the 64 rows of a word, for k < 6
+PATTERNS = [np.uint64(sum(1 << i for i in range(64) if i >> k & 1)) for k in range(6)]
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+# largest chunk, and with several workers the smallest one and how many chunks each worker should get at least
+CHUNK_WORDS = 1 << 16
+MIN_CHUNK_WORDS = 1 << 10
+CHUNKS_PER_WORKER = 4
+
+# file format: header, then the variable names as lengths and UTF-8 bytes, then the bits aligned on 8 bytes
+MAGIC = b"LGTT"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sBxxxI")
+NAME_LENGTH = struct.Struct("<H")
+
+
+def column(k: int, words: np.ndarray) -> Bits:
+    """Value of the k-th bit of the row index, for every row of the given words"""
+    if k < 6:
+        return PATTERNS[k]
+    return (words >> np.uint64(k - 6) & np.uint64(1)) * ONES
+
+
+def evaluate_bits(term: Term, columns: Dict[str, Bits], memo: Dict[Term, Bits]) -> Bits:
+    # iterative, children first, so that deep terms don't hit the recursion limit
+    stack = [(term, False)]
+    while stack:
+        t, ready = stack.pop()
+        if t in memo:
+            continue
+        if isinstance(t, Positive):
+            memo[t] = ONES
+            continue
+        if isinstance(t, Negative):
+            memo[t] = ZEROS
+            continue
+        if isinstance(t, NamedValue):
+            if t.name not in columns:
+                raise UnboundLocalError(f"Unbound value {t.name}")
+            memo[t] = columns[t.name]
+            continue
+        if not isinstance(t, (Not, And, Or, Imp, Equ)):
+            raise NotImplementedError
+        args = t.get_args()
+        if not ready:
+            stack.append((t, True))
+            stack.extend((arg, False) for arg in args if arg not in memo)
+            continue
+
+        if isinstance(t, Not):
+            res = ~memo[t.elem]
+        elif isinstance(t, And):
+            res = reduce(operator.and_, (memo[arg] for arg in args), ONES)
+        elif isinstance(t, Or):
+            res = reduce(operator.or_, (memo[arg] for arg in args), ZEROS)
+        elif isinstance(t, Imp):
+            res = ~memo[args[0]] | memo[args[1]]
+        else:
+            res = ~(memo[args[0]] ^ memo[args[1]])
+        memo[t] = res
+    return memo[term]
+
+
+def evaluate_words(term: Term, variables: Sequence[str], start: int, stop: int) -> np.ndarray:
+    """Evaluates the rows 64 * start to 64 * stop of the table of term, packed as words"""
+    words = np.arange(start, stop, dtype=np.uint64)
+    columns = {name: column(len(variables) - 1 - i, words) for i, name in enumerate(variables)}
+    res = np.broadcast_to(evaluate_bits(term, columns, {}), words.shape).astype(WORD)
+    if len(variables) < 6:
+        res &= np.uint64((1 << (1 << len(variables))) - 1)
+    return res
+
+
+# term evaluated by a worker process, set once when the pool starts instead of being sent with every chunk
+worker_args: Tuple[Optional[Term], Sequence[str]] = (None, ())
+
+
+def set_worker_args(term: Term, variables: Sequence[str]):
+    global worker_args
+    worker_args = term, variables
+
+
+def evaluate_chunk(start: int, stop: int) -> np.ndarray:
+    return evaluate_words(*worker_args, start, stop)
+
+
+def get_chunk_words(words: int, workers: Optional[int] = None) -> int:
+    """Words per chunk for a table of that many words: small enough to give every worker several chunks, so that the
+    load stays balanced, but not so small that the chunks cost more to ship than to evaluate"""
+    if workers is None or workers < 2:
+        return CHUNK_WORDS
+    # words is a power of two, and so is the result
+    target = max(1, words // (CHUNKS_PER_WORKER * workers))
+    return max(MIN_CHUNK_WORDS, min(CHUNK_WORDS, 1 << (target.bit_length() - 1)))
+
+
+def iter_chunks(term: Term, variables: Sequence[str],
+                workers: Optional[int] = None) -> Iterator[Tuple[int, np.ndarray]]:
+    """Packed words of the table of term with the index of their first word, in order, one chunk at a time
+
+    Each chunk is a power of two of rows, so it fixes the values of the first variables. With several workers, the
+    chunks are evaluated in a process pool, at most two per worker at a time so that memory stays bounded."""
+    words = max(1, (1 << len(variables)) // 64)
+    size = get_chunk_words(words, workers)
+    ranges = [(start, min(words, start + size)) for start in range(0, words, size)]
+    if workers is None or workers < 2 or len(ranges) < 2:
+        for start, stop in ranges:
+            yield start, evaluate_words(term, variables, start, stop)
+        return
+
+    results = map_ordered(evaluate_chunk, ranges, workers, set_worker_args, (term, variables))
+    for (start, _), chunk in zip(ranges, results):
+        yield start, chunk
+
+
+def iter_models(term: Term, workers: Optional[int] = None) -> Iterator[Interpretation]:
+    """Assignments of the variables of term that make it true, in the order of the rows of its table"""
+    variables = sorted({v.name for v in term.get_vars()})
+    n = len(variables)
+    for start, words in iter_chunks(term, variables, workers):
+        rows = np.flatnonzero(np.unpackbits(words.view(np.uint8), bitorder="little"))
+        for row in map(int, rows + start * 64):
+            yield Interpretation({name: bool(row >> (n - 1 - i) & 1) for i, name in enumerate(variables)})
+
+
+def popcount(bits: np.ndarray) -> int:
+    return int(POPCOUNT[bits].sum(dtype=np.int64))
+
+
+def write_header(file: BinaryIO, variables: Sequence[str]) -> int:
+    """Writes everything before the bits, returns its size"""
+    data = bytearray(HEADER.pack(MAGIC, FORMAT_VERSION, len(variables)))
+    for name in variables:
+        encoded = name.encode("utf-8")
+        data += NAME_LENGTH.pack(len(encoded)) + encoded
+    data += bytes(-len(data) % 8)
+    file.write(data)
+    return len(data)
+
+
+def read_header(file: BinaryIO) -> Tuple[Sequence[str], int]:
+    """Variables of a saved table and the offset of its bits"""
+    magic, version, count = HEADER.unpack(file.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError("Not a truth table file")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported truth table format version {version}")
+    variables = []
+    for _ in range(count):
+        length, = NAME_LENGTH.unpack(file.read(NAME_LENGTH.size))
+        variables.append(file.read(length).decode("utf-8"))
+    return variables, file.tell() + -file.tell() % 8
+
+
+def write_rows(file: TextIO, variables: Sequence[str], term: Optional[Term],
+               rows: Iterable[Tuple[Tuple[bool, ...], bool]], details: bool = True):
+    """Writes a table line by line; with details, each row also shows term simplified for its values"""
+    variables_obj = list(map(Variable, variables))
+    header = " | ".join(variables) + " | " + (str(term) if term else "RESULT")
+    file.write(header + "\n" + "-" * len(header))
+    for vals, res in rows:
+        file.write("\n" + " | ".join("FT"[x] for x in vals) + " | " + "FT"[res])
+        if details and term is not None:
+            file.write(" | " + str(simplify(term.apply_subs(dict(zip(variables_obj, map(Literal.from_bool, vals)))))))
 
 
 @dataclasses.dataclass
 class TruthTable:
-    table: Dict[Tuple[bool], bool]
-    variables: Optional[Sequence[str]] = None
+    # row i is bit i of the buffer, in little-endian bit order; the first variable is the most significant bit of i
+    bits: np.ndarray
+    variables: Sequence[str]
     term: Optional[Term] = None
 
     @staticmethod
-    def from_term(term: Term) -> "TruthTable":
-        variables = sorted(v.name for v in term.get_vars())
-        return TruthTable({
-            tuple(vals): term.evaluate(Interpretation(dict(zip(variables, vals))))
-            for vals in itertools.product((False, True), repeat=len(variables))
-        }, variables, term)
+    def from_term(term: Term, workers: Optional[int] = None) -> "TruthTable":
+        """Table of term, evaluated by a pool of the given number of processes if there is more than one"""
+        variables = sorted({v.name for v in term.get_vars()})
+        bits = np.empty(max(1, (1 << len(variables)) // 8), dtype=np.uint8)
+        for start, words in iter_chunks(term, variables, workers):
+            chunk = words.view(np.uint8)
+            bits[start * 8:start * 8 + len(chunk)] = chunk[:len(bits) - start * 8]
+        return TruthTable(bits, variables, term)
+
+    def __len__(self):
+        return 1 << len(self.variables)
+
+    def __getitem__(self, row: int) -> bool:
+        return bool(self.bits[row >> 3] >> (row & 7) & 1)
+
+    def get_column(self) -> np.ndarray:
+        return np.unpackbits(self.bits, count=len(self), bitorder="little").astype(bool)
+
+    def rows(self) -> Iterator[Tuple[Tuple[bool, ...], bool]]:
+        return zip(itertools.product((False, True), repeat=len(self.variables)), map(bool, self.get_column()))
+
+    @property
+    def table(self) -> Dict[Tuple[bool, ...], bool]:
+        return dict(self.rows())
+
+    def __str__(self):
+        out = io.StringIO()
+        write_rows(out, self.variables, self.term, self.rows())
+        return out.getvalue()
+
+    def get_truth_density(self) -> float:
+        return popcount(self.bits) / len(self)
+
+    def get_operator_number(self) -> int:
+        return int.from_bytes(self.bits.tobytes(), "little")
+
+    def save(self, path: str):
+        """Writes the variables and bits to a file, without the term"""
+        with open(path, "wb") as file:
+            write_header(file, self.variables)
+            file.write(self.bits.tobytes())
+
+    @staticmethod
+    def load(path: str, mode: str = "r") -> "TruthTable":
+        """Maps a saved table into memory, so its pages are only read when used and shared between processes
+
+        mode is the mode of np.memmap: "r" for read-only, "r+" to write through to the file, "c" for copy-on-write."""
+        with open(path, "rb") as file:
+            variables, offset = read_header(file)
+        bits = np.memmap(path, dtype=np.uint8, mode=mode, offset=offset, shape=(max(1, (1 << len(variables)) // 8),))
+        return TruthTable(bits, variables)
+
+
+class LazyTruthTable:
+    """Truth table of a term whose rows are only evaluated when asked for, a chunk at a time"""
+
+    def __init__(self, term: Term, workers: Optional[int] = None):
+        self.term = term
+        self.variables = sorted({v.name for v in term.get_vars()})
+        self.workers = workers
+
+    def __len__(self):
+        return 1 << len(self.variables)
+
+    def get_values(self, row: int) -> Tuple[bool, ...]:
+        n = len(self.variables)
+        return tuple(bool(row >> (n - 1 - i) & 1) for i in range(n))
+
+    def iter_columns(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Tuple[int, np.ndarray]]:
+        """Results of the rows start to stop, as boolean arrays along with the index of their first row"""
+        stop = len(self) if stop is None else min(stop, len(self))
+        if start == 0 and stop == len(self):
+            for first, words in iter_chunks(self.term, self.variables, self.workers):
+                yield first * 64, np.unpackbits(words.view(np.uint8), count=min(64 * len(words), stop),
+                                                bitorder="little").astype(bool)
+            return
+        for first in range(start // 64, -(-stop // 64), CHUNK_WORDS):
+            last = min(-(-stop // 64), first + CHUNK_WORDS)
+            words = evaluate_words(self.term, self.variables, first, last)
+            col = np.unpackbits(words.view(np.uint8), bitorder="little").astype(bool)
+            lo = max(start, first * 64)
+            yield lo, col[lo - first * 64:min(stop, last * 64) - first * 64]
+
+    def rows(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Tuple[Tuple[bool, ...], bool]]:
+        for first, col in self.iter_columns(start, stop):
+            for i, res in enumerate(col.tolist(), first):
+                yield self.get_values(i), res
+
+    def __getitem__(self, key: Union[int, slice]) -> Union[bool, np.ndarray]:
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step < 0:
+                return self[stop + 1:start + 1][::-1][::-step]
+            cols = [col for _, col in self.iter_columns(start, stop)]
+            return np.concatenate(cols)[::step] if cols else np.zeros(0, dtype=bool)
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError(key)
+        return bool(next(self.iter_columns(key, key + 1))[1][0])
+
+    def write(self, file: TextIO, start: int = 0, stop: Optional[int] = None, details: bool = False):
+        """Writes the rows start to stop as they are evaluated; details simplifies the term for each row, slowly"""
+        write_rows(file, self.variables, self.term, self.rows(start, stop), details)
 
     def __str__(self):
-        variables = self.variables or [chr(ord("A") + x) for x in range(len([*self.table.keys()][0]))]
-        variables_obj = list(map(Variable, variables))
-        header = " | ".join(variables) + " | " + (str(self.term) if self.term else "RESULT")
-        lines = [header, "-" * len(header)]
-        for vals, res in self.table.items():
-            lines.append(" | ".join("FT"[x] for x in vals) + " | " + "FT"[res] + " | " +
-                         str(simplify(self.term.apply_subs(dict(zip(variables_obj, map(Literal.from_bool, vals)))))))
-        return "\n".join(lines)
+        out = io.StringIO()
+        self.write(out)
+        return out.getvalue()
 
     def get_truth_density(self) -> float:
-        return sum(self.table.values()) / len(self.table)
+        return sum(popcount(words.view(np.uint8))
+                   for _, words in iter_chunks(self.term, self.variables, self.workers)) / len(self)
 
     def get_operator_number(self) -> int:
-        return sum(v * 2 ** i for i, v in enumerate(self.table.values()))
\ No newline at end of file
+        data = bytearray()
+        for _, words in iter_chunks(self.term, self.variables, self.workers):
+            data += words.view(np.uint8).tobytes()
+        return int.from_bytes(data, "little")
+
+    def save(self, path: str):
+        """Writes the table to a file in the format of TruthTable.save, a chunk at a time"""
+        with open(path, "wb") as file:
+            write_header(file, self.variables)
+            for _, words in iter_chunks(self.term, self.variables, self.workers):
+                file.write(words.view(np.uint8)[:max(1, len(self) // 8)].tobytes())
+
+    def materialize(self) -> TruthTable:
+        return TruthTable.from_term(self.term, self.workers)
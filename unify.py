@@ -3,21 +3,19 @@
 # deterministic
 import dataclasses
 import itertools
-from functools import lru_cache
-from typing import Iterable, Tuple, Dict, List
+from typing import Iterable, Iterator, Tuple, Dict, List, Optional
 
+import tracing
+from cache import cached
 from expression import Term, Constant, Variable, Predicate, VariadicOp, NamedPredicate, Quantifier
 
 Unification = Dict[Term, Term]
 Unifications = Iterable[Unification]
 
 
-def unify_args(test: Iterable[Tuple[Term, Term]], res=None, bidi: bool = False) -> Unifications:
+def unify_args(test: List[Tuple[Term, Term]], res=None, bidi: bool = False) -> Unifications:
     for a1, a2 in test:
-        if not (subs := find_unifications(a1, a2, bidi)):
-            return []  # no unification
-        choices = []
-        for sub in subs:
+        for sub in find_unifications(a1, a2, bidi):
             if res is None:
                 nres = sub
             else:
@@ -27,16 +25,31 @@ def unify_args(test: Iterable[Tuple[Term, Term]], res=None, bidi: bool = False)
                 nres.update(sub)
             new_args = test[1:]
             if bidi:
-                new_args = [(b1.apply_subs(nres), b2.apply_subs(nres)) for b1, b2 in new_args[1:]]
-            choices.extend(unify_args(new_args, nres, bidi))
-        return choices
-    else:
-        return [res]
+                new_args = [(b1.apply_subs(nres), b2.apply_subs(nres)) for b1, b2 in new_args]
+            yield from unify_args(new_args, nres, bidi)
+        return
+    yield {} if res is None else res
+
+
+def iter_unifications(haystack: Term, needle: Term, bidi: bool = False,
+                      limit: Optional[int] = None) -> Iterator[Unification]:
+    """Distinct unifications of needle with haystack, produced lazily and at most limit of them"""
+    if limit is not None and limit <= 0:
+        return
+    seen = set()
+    for unif in gen_unifications(haystack, needle, bidi):
+        key = frozenset(unif.items())
+        if key in seen:
+            continue
+        seen.add(key)
+        yield unif
+        if len(seen) == limit:
+            return
 
 
-@lru_cache(maxsize=32)
-def find_unifications(haystack: Term, needle: Term, bidi: bool = False) -> Unifications:
-    return [dict(t) for t in {frozenset(d.items()) for d in gen_unifications(haystack, needle, bidi)}]
+@cached("find_unifications")
+def find_unifications(haystack: Term, needle: Term, bidi: bool = False) -> List[Unification]:
+    return list(iter_unifications(haystack, needle, bidi))
 
 
 def gen_unifications(haystack: Term, needle: Term, bidi: bool = False) -> Unifications:
@@ -62,6 +75,8 @@ def gen_unifications(haystack: Term, needle: Term, bidi: bool = False) -> Unific
             return [{l2: l1}]
 
     if isinstance(haystack, Predicate) and isinstance(needle, Predicate):
+        if tracing.tracer is not None:
+            return tracing.tracer.trace_unify(unify_functions(haystack, needle, bidi), haystack, needle)
         return unify_functions(haystack, needle, bidi)
 
     return []
@@ -86,8 +101,7 @@ def unify_functions(haystack: Predicate, needle: Predicate, bidi: bool = False)
                     node_type = type(needle)
                     for comb in test1:
                         comb = [node_type(arg) if len(arg) > 1 else arg[0] for arg in comb]
-                        for n in itertools.permutations(na):
-                            yield from unify_args(list(zip(comb, n)), bidi=bidi)
+                        yield from unify_commutative(comb, list(na), bidi)
                     #combs = [list(zip(h, n))
                     #         for h in itertools.combinations(ha, len(na))
                     #         for n in itertools.permutations(na)]
@@ -119,16 +133,77 @@ def unify_functions(haystack: Predicate, needle: Predicate, bidi: bool = False)
 
     # can unify if all parameters are unifiable, elementwise
     if haystack.commutes():
-        # test all ways to associate the parameters
-        tests = [list(zip(h, n))
-                 for h in itertools.permutations(haystack.get_args())
-                 for n in itertools.permutations(needle.get_args())]
+        # in any order
+        yield from unify_commutative(list(haystack.get_args()), list(needle.get_args()), bidi)
     else:
         # direct bijection
-        tests = [list(zip(haystack.get_args(), needle.get_args()))]
+        yield from unify_args(list(zip(haystack.get_args(), needle.get_args())), bidi=bidi)
+
+
+def is_ground(term: Term) -> bool:
+    """Whether term can only be unified with itself"""
+    for t in term.get_children():
+        if isinstance(t, Quantifier):
+            return False
+        if isinstance(t, Variable) and t.name[0] == "$" or isinstance(t, Constant) and t.name[-1] == "#":
+            return False
+        if isinstance(t, VariadicOp) and t.placeholder == "*":
+            return False
+    return True
+
+
+def unify_commutative(hargs: List[Term], nargs: List[Term], bidi: bool = False) -> Unifications:
+    """Unifies each argument of the needle with a distinct argument of the haystack, both of the same length
+
+    Ground arguments are paired up by equality first, then the others are matched most constrained first, and
+    each partial matching is dropped as soon as its substitutions conflict."""
+    if bidi:
+        # substitutions are applied to the remaining pairs as they are found: pair the needle arguments, in a fixed
+        # order, with each haystack argument left, and drop a branch as soon as it fails
+        def pair(hs: List[Term], ns: List[Term], res: Optional[Unification]) -> Unifications:
+            if not ns:
+                yield {} if res is None else res
+                return
+            n = ns[0] if res is None else ns[0].apply_subs(res)
+            for i, h in enumerate(hs):
+                test = [(h if res is None else h.apply_subs(res), n)]
+                for nres in unify_args(test, res, bidi):
+                    yield from pair(hs[:i] + hs[i + 1:], ns[1:], nres)
+
+        yield from pair(sorted(hargs, key=str), sorted(nargs, key=str), None)
+        return
+
+    hargs = list(hargs)
+    pending = []
+    for n in nargs:
+        if is_ground(n):
+            if n not in hargs:
+                return
+            hargs.remove(n)
+        else:
+            pending.append(n)
+
+    options = []
+    for n in pending:
+        opts = [(i, subs) for i, h in enumerate(hargs) if (subs := find_unifications(h, n))]
+        if not opts:
+            return
+        options.append(opts)
+    options.sort(key=len)
+
+    def match(k: int, used: int, res: Unification) -> Unifications:
+        if k == len(options):
+            yield res
+            return
+        for i, subs in options[k]:
+            if used >> i & 1:
+                continue
+            for sub in subs:
+                if any(src in res and dest != res[src] for src, dest in sub.items()):
+                    continue  # conflict
+                yield from match(k + 1, used | 1 << i, {**res, **sub})
 
-    for test in tests:
-        yield from unify_args(test, bidi=bidi)
+    yield from match(0, 0, {})
 
 
 def k_subset(ns: List, m: int):